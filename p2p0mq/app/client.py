@@ -43,6 +43,10 @@ class Sender(KoNetThread):
     - fast (sends all available messages every loop);
     - medium (sends oldest message of each peer every loop);
     - slow (sends oldest overall message;one message per loop).
+
+    Peers that need to be connected are placed in the `connection_queue`
+    as `(peer, message)` pairs (see :meth:`~enqueue_connect`); the message
+    is sent after the socket is connected to the peer.
     """
     def __init__(self, *args, **kwargs):
         """ Constructor. """
@@ -148,7 +152,7 @@ class Sender(KoNetThread):
         try:
             logger.log(TRACE_NET, "encoding message for wire: %r", message)
             assert message.valid_for_send(self.app), "%r is invalid" % message
-            encoded = message.encode(self.app.uuid)
+            encoded = message.encode(self.app_uuid)
             logger.log(TRACE_PACKETS, ">>>>>>>>>>>>>>>  %r", encoded)
             self.socket.send_multipart(encoded)
             message.handler.message_sent(message)
@@ -193,9 +197,12 @@ class Sender(KoNetThread):
             result = self.connection_queue.dequeue()
             assert len(result) == 1
             result = result[0]
-            assert len(result) == 1
-            peer = list(result)[0]
-            message = result[peer]
+            if isinstance(result, dict):
+                # Deprecated format: a {peer: message} dictionary.
+                assert len(result) == 1
+                peer, message = next(iter(result.items()))
+            else:
+                peer, message = result
             logger.debug("Connecting peer %r...", peer.uuid)
             try:
                 if not hasattr(peer, '_first_connect'):
@@ -232,6 +239,21 @@ class Sender(KoNetThread):
             self.execute_queue(queue)
         return LOOP_CONTINUE
 
+    def enqueue_connect(self, peer, message):
+        """ Asks the sender to connect to a peer and then send
+        the message to it. """
+        self.connection_queue.enqueue_pair(peer, message)
+
+    def enqueue_connects(self, pairs):
+        """ Asks the sender to connect to a number of peers.
+
+        Arguments:
+            pairs (list):
+                The `(peer, message)` tuples, each handled as if
+                :meth:`~enqueue_connect` was called for it.
+        """
+        self.connection_queue.enqueue(list(pairs))
+
     def enqueue(self, message, priority=SPEED_MEDIUM):
         """ Adds one or more messages to internal queue
         to be send later. """
@@ -247,41 +269,33 @@ class Sender(KoNetThread):
         self.sleep.set()
 
     def enqueue_all(self, requests=None, replies=None, routed=None):
-        """ Enqueues all kinds of messages. """
+        """ Enqueues all kinds of messages.
+
+        Messages of the same priority are gathered in a single list so that
+        each queue is locked and validated only once per call.
+        The dictionaries and the list received as arguments are not changed.
+        """
         fast = []
         medium = []
         slow = []
 
-        if requests is not None:
-            if SPEED_FAST in requests:
-                fast = requests[SPEED_FAST]
-            if SPEED_MEDIUM in requests:
-                medium = requests[SPEED_MEDIUM]
-            if SPEED_SLOW in requests:
-                slow = requests[SPEED_SLOW]
-
-        if replies is not None:
-            if SPEED_FAST in replies:
-                fast = fast + replies[SPEED_FAST]
-            if SPEED_MEDIUM in replies:
-                medium = medium + replies[SPEED_MEDIUM]
-            if SPEED_SLOW in replies:
-                slow = slow + replies[SPEED_SLOW]
-
-        if routed is not None:
-            fast = fast + routed
-
-        total = len(fast) + len(medium) + len(slow)
-
-        if len(fast) > 0:
-            assert Message.validate_messages_for_send(fast, self.app)
-            self.fast_queue.enqueue(fast)
-        if len(medium) > 0:
-            assert Message.validate_messages_for_send(medium, self.app)
-            self.medium_queue.enqueue(medium)
-        if len(slow) > 0:
-            assert Message.validate_messages_for_send(slow, self.app)
-            self.slow_queue.enqueue(slow)
+        for source in (requests, replies):
+            if source:
+                fast.extend(source.get(SPEED_FAST, ()))
+                medium.extend(source.get(SPEED_MEDIUM, ()))
+                slow.extend(source.get(SPEED_SLOW, ()))
+
+        if routed:
+            fast.extend(routed)
+
+        total = 0
+        for queue, messages in ((self.fast_queue, fast),
+                                (self.medium_queue, medium),
+                                (self.slow_queue, slow)):
+            if len(messages) > 0:
+                assert Message.validate_messages_for_send(messages, self.app)
+                queue.enqueue(messages)
+                total = total + len(messages)
 
         if total > 0:
             self.sleep.set()
@@ -5,7 +5,8 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
-from time import sleep
+import threading
+from time import monotonic
 
 import zmq
 from zmq.utils.monitor import recv_monitor_message
@@ -22,6 +23,12 @@ from .server import Receiver
 
 logger = logging.getLogger('p2p0mq.app')
 
+# Maps the values of zmq monitor events to their names.
+EVENT_MAP = {
+    getattr(zmq, name): name
+    for name in dir(zmq) if name.startswith('EVENT_')
+}
+
 
 class LocalPeer(PeerStore, SecurityManager,
                 ConcernsManager, Router, KoLoopThread):
@@ -43,6 +50,12 @@ class LocalPeer(PeerStore, SecurityManager,
             Configuration options loaded at startup.
         zmq_monitor (zmq.Poller):
             Brings together all monitoring sockets.
+        stabilized (threading.Event):
+            Set by the loop once the local peer becomes
+            :meth:`stable <stable>`.
+        monitor_sockets (dict):
+            The monitoring sockets registered with `zmq_monitor`, mapped
+            to the label used when logging their events.
         zmq_context (zmq.Context):
             The zmq resource management structure.
         receiver (Receiver):
@@ -51,6 +64,16 @@ class LocalPeer(PeerStore, SecurityManager,
         sender (Sender):
             The client used by local peer. It runs on a separate thread
             and has a distinct web address.
+        request_queue (SlowMessageQueue):
+            The receiver queue for requests; cached at create time.
+        reply_queue (SlowMessageQueue):
+            The receiver queue for replies; cached at create time.
+        route_queue (SlowMessageQueue):
+            The receiver queue for messages that need routing;
+            cached at create time.
+        skip_validation (bool):
+            When set, the messages are not checked before being queued
+            or sent (see :meth:`p2p0mq.message.Message.valid_for_send`).
     """
     def __init__(self, config,
                  sender_address='127.0.0.1', sender_port=8341,
@@ -83,6 +106,8 @@ class LocalPeer(PeerStore, SecurityManager,
             else ('%s-p2p0mq.A.th' % self.uuid[-4:-1].decode("utf-8"))
         self.config = config
         self.zmq_monitor = zmq.Poller() if zmq_monitor else None
+        self.monitor_sockets = None
+        self.stabilized = threading.Event()
         self.zmq_context = zmq_context or zmq.Context.instance()
         self.receiver = Receiver(
             app=self, context=self.zmq_context,
@@ -90,6 +115,10 @@ class LocalPeer(PeerStore, SecurityManager,
         self.sender = Sender(
             app=self, context=self.zmq_context,
             bind_address=sender_address, bind_port=sender_port)
+        self.request_queue = None
+        self.reply_queue = None
+        self.route_queue = None
+        self.skip_validation = False
         logger.debug('application constructed')
 
     def create(self):
@@ -99,6 +128,13 @@ class LocalPeer(PeerStore, SecurityManager,
         self.prepare_cert_store(self.uuid)
         self.start_auth(self.zmq_context)
         self.start_concerns()
+
+        # The queues are created with the receiver and never replaced.
+        typed_queues = self.receiver.typed_queues
+        self.request_queue = typed_queues[MESSAGE_TYPE_REQUEST]
+        self.reply_queue = typed_queues[MESSAGE_TYPE_REPLY]
+        self.route_queue = typed_queues[MESSAGE_TYPE_ROUTE]
+
         self.receiver.start()
         self.sender.start()
         logger.debug("The local peer %r was created", self.uuid)
@@ -120,8 +156,7 @@ class LocalPeer(PeerStore, SecurityManager,
         if self.sender is not None:
             self.sender.stop.set()
 
-        sleep(0.5)
-
+        # Joining the threads waits for them to release their sockets.
         if self.receiver is not None:
             self.receiver.join()
             assert self.receiver.socket is None
@@ -142,17 +177,17 @@ class LocalPeer(PeerStore, SecurityManager,
 
         self.execute_concerns()
 
-        replies = self.process_requests(
-            self.receiver.typed_queues[MESSAGE_TYPE_REQUEST])
-        requests = self.process_replies(
-            self.receiver.typed_queues[MESSAGE_TYPE_REPLY])
-        routed = self.process_routes(
-            self.receiver.typed_queues[MESSAGE_TYPE_ROUTE])
+        replies = self.process_requests(self.request_queue)
+        requests = self.process_replies(self.reply_queue)
+        routed = self.process_routes(self.route_queue)
 
-        self.sender.enqueue_all(replies, requests, routed)
+        self.sender.enqueue_all(
+            requests=requests, replies=replies, routed=routed)
         logger.log(TRACE_FUNC, "Application %r ends execute", self.uuid)
 
         self.monitor()
+        if not self.stabilized.is_set() and self.stable():
+            self.stabilized.set()
         return LOOP_CONTINUE
 
     def monitor(self):
@@ -160,34 +195,36 @@ class LocalPeer(PeerStore, SecurityManager,
         if not self.zmq_monitor:
             return
 
-        if len(self.zmq_monitor.sockets) == 0:
-            if self.receiver is not None and self.receiver.socket is not None:
-                if self.sender is not None and self.sender.socket is not None:
-                    self.zmq_monitor.register(
-                        self.receiver.socket.get_monitor_socket())
-                    self.zmq_monitor.register(
-                        self.sender.socket.get_monitor_socket())
-                    event_map = {}
-                    setattr(self, 'event_map', event_map)
-                    # print("Event names:")
-                    for name in dir(zmq):
-                        if name.startswith('EVENT_'):
-                            value = getattr(zmq, name)
-                            # print("%21s : %4i" % (name, value))
-                            event_map[value] = name
-
-        event_map = getattr(self, 'event_map')
-        socket_rec = self.zmq_monitor.sockets[0]
-        socket_se = self.zmq_monitor.sockets[1]
-        socks = dict(self.zmq_monitor.poll(100))
-        if socket_rec in socks and socks[socket_rec] & zmq.POLLIN:
-            message = recv_monitor_message(socket_rec)
-            message.update({'description': event_map[message['event']]})
-            logger.log(TRACE_NET, "RECEIVER: %r", message)
-        if socket_se in socks and socks[socket_se] & zmq.POLLIN:
-            message = recv_monitor_message(socket_se)
-            message.update({'description': event_map[message['event']]})
-            logger.log(TRACE_NET, "SENDER: %r", message)
+        if self.monitor_sockets is None:
+            if self.receiver is None or self.receiver.socket is None:
+                return
+            if self.sender is None or self.sender.socket is None:
+                return
+
+            # The sockets are registered only once; after that we simply
+            # poll them without waiting.
+            socket_rec = self.receiver.socket.get_monitor_socket()
+            socket_se = self.sender.socket.get_monitor_socket()
+            self.zmq_monitor.register(socket_rec, zmq.POLLIN)
+            self.zmq_monitor.register(socket_se, zmq.POLLIN)
+            self.monitor_sockets = {
+                socket_rec: 'RECEIVER',
+                socket_se: 'SENDER',
+            }
+
+        for sock, events in self.zmq_monitor.poll(0):
+            if not events & zmq.POLLIN:
+                continue
+            label = self.monitor_sockets[sock]
+
+            # Read all the events that have accumulated so far.
+            while True:
+                try:
+                    message = recv_monitor_message(sock, zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                message['description'] = EVENT_MAP.get(message['event'])
+                logger.log(TRACE_NET, "%s: %r", label, message)
 
     def stable(self):
         """ Tell if the local peer is started. """
@@ -203,11 +240,25 @@ class LocalPeer(PeerStore, SecurityManager,
             partial = self.auth_thread is not None
         return partial
 
-    def wait_to_stabilize(self):
-        """ Wait for the local peer to became stable. """
-        for i in range(STABILIZE_TIMEOUT*2):
-            if self.stable():
+    def wait_to_stabilize(self, timeout=STABILIZE_TIMEOUT):
+        """ Wait for the local peer to became stable.
+
+        The wait ends early if the thread of the local peer was started
+        and has already exited (for example because create() failed).
+
+        Arguments:
+            timeout (float):
+                The maximum number of seconds to wait.
+        Returns:
+            True if the local peer is stable, False otherwise.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return self.stabilized.is_set()
+            if self.stabilized.wait(timeout=min(remaining, 0.05)):
                 return True
-            sleep(0.5)
-        return False
+            if self.ident is not None and not self.is_alive():
+                return self.stabilized.is_set()
 
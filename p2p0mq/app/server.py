@@ -176,7 +176,7 @@ class Receiver(KoNetThread):
             raw_data = self.socket.recv_multipart(copy=True)
             logger.log(TRACE_PACKETS, "<<<<<<<<<<<<<<<   received message %r",
                        raw_data)
-            message = Message.parse(raw_data, self.app.uuid)
+            message = Message.parse(raw_data, self.app_uuid)
             logger.log(TRACE_NET, "converted into message %r", message)
         except Exception:
             logger.error("Received invalid message",
@@ -21,10 +21,14 @@ class AskAroundConcern(Concern):
     certain peer.
     """
 
+    # The key of the concern in the concerns of the local peer.
+    command_id = b'r'
+
     def __init__(self, *args, **kwargs):
         """ Constructor. """
         super(AskAroundConcern, self).__init__(
-            name="ask around", command_id=b'r', *args, **kwargs)
+            name="ask around", command_id=AskAroundConcern.command_id,
+            *args, **kwargs)
 
     def compose_ask_around_message(self, peer, exclude, breadcrumbs=None):
         """
@@ -87,6 +91,7 @@ class AskAroundConcern(Concern):
                 if peer.state_connected:
                     logger.log(TRACE, "Found the peer and is connected.")
                     return SPEED_FAST, message.create_reply(
+                        now=self.app.tick,
                         target=target,
                         breadcrumbs=breadcrumbs)
             else:
@@ -142,5 +147,6 @@ class AskAroundConcern(Concern):
             to=requester,
             previous_hop=None,
             next_hop=requester,
+            now=self.app.tick,
             target=target,
             breadcrumbs=breadcrumbs)
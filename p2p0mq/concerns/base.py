@@ -6,6 +6,8 @@ from __future__ import print_function
 
 import logging
 
+from p2p0mq.constants import EXECUTE_BUDGET
+
 logger = logging.getLogger('p2p0mq.concern')
 
 
@@ -21,6 +23,10 @@ class Concern(object):
             Human readable name of this concern.
         app (ConcernsManager):
             The manager where this concern is installed.
+        execute_budget (float):
+            The number of seconds :meth:`~execute` is expected to take;
+            the manager logs the calls that take longer. `None`
+            disables the check.
     """
     def __init__(self, name, command_id, app=None, *args, **kwargs):
         """
@@ -43,6 +49,7 @@ class Concern(object):
         self.app = app
         self.command_id = command_id
         self.name = name
+        self.execute_budget = EXECUTE_BUDGET
 
     def __str__(self):
         return 'Concern(%r, %r)' % (self.command_id, self.name)
@@ -71,7 +78,11 @@ class Concern(object):
         pass
 
     def execute(self):
-        """ Called from application thread on each thread loop. """
+        """ Called from application thread on each thread loop.
+
+        Concerns that may have a lot of work should only do a bounded
+        amount of it in each call and resume in the next loop, so
+        that other concerns are not delayed. """
         pass
 
     def process_request(self, message):
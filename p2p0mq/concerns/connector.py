@@ -5,12 +5,16 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+from collections import deque
+from itertools import islice
 
 from p2p0mq.concerns.base import Concern
 from p2p0mq.constants import HEART_BEAT_INTERVAL, TRACE, SPEED_FAST, HEART_BEAT_SLOW_DOWN, HEART_BEAT_MAX_INTERVAL, \
-    UNRESPONSIVE_THRESHOLD, UNRESPONSIVE_RECONNECT_WAIT
+    UNRESPONSIVE_THRESHOLD, UNRESPONSIVE_RECONNECT_WAIT, CONNECT_LIMIT_PER_LOOP
 from p2p0mq.message import Message
-from p2p0mq.peer import Peer
+from p2p0mq.peer import (
+    Peer, INITIAL, CONNECTING, NO_CONNECTION, RECONNECT_STATES
+)
 
 logger = logging.getLogger('p2p0mq.concern.con')
 
@@ -24,76 +28,148 @@ class ConnectorConcern(Concern):
 
     For peers in initial state we instruct the sender to connect to them and,
     once connected, we send them the greetings message.
+
+    Attributes:
+        hello_template (Message):
+            The greetings message that is copied for each peer; it is
+            created the first time it is needed.
+        schedule (PeerSchedule):
+            The CONNECTING and NO_CONNECTION peers ordered by their
+            heart-beat time; created when the concern is started.
+        state_handlers (dict):
+            Maps the connection state of a peer to the method that
+            handles peers in that state in :meth:`~execute`.
+        sender_events (collections.deque):
+            The outcome of our messages as reported by the sending thread
+            (handler, peer uuid, message id); consumed by :meth:`~execute` in the
+            application thread.
     """
 
     def __init__(self, *args, **kwargs):
         """ Constructor. """
         super(ConnectorConcern, self).__init__(
             name="connector", command_id=b'hello', *args, **kwargs)
+        self.hello_template = None
+        self.sender_events = deque()
+        self.schedule = None
+        self.state_handlers = {
+            INITIAL: self.connect_peer,
+            CONNECTING: self.connecting_peer,
+            NO_CONNECTION: self.reconnect_peer,
+        }
+
+    def start(self):
+        """ Starts tracking the peers that are being connected.
+
+        The address of the local peer may have changed, so the
+        template is discarded. """
+        self.hello_template = None
+        with self.app.peers_lock:
+            self.schedule = self.app.peers.add_schedule(
+                (CONNECTING, NO_CONNECTION))
+
+    def terminate(self):
+        """ Stops tracking the peers that are being connected. """
+        if self.schedule is not None:
+            with self.app.peers_lock:
+                self.app.peers.remove_schedule(self.schedule)
+            self.schedule = None
+
+    def compose_hello(self, peer):
+        """
+        Creates the greetings message for a peer.
+
+        Arguments:
+            peer (Peer):
+                The peer we should send the message to.
+        """
+        template = self.hello_template
+        if template is None:
+            template = Message(
+                source=self.app.uuid,
+                previous_hop=None,
+                command=self.command_id,
+                reply=False,
+                handler=self,
+                host=self.app.receiver.bind_address,
+                port=self.app.receiver.bind_port,
+            )
+            self.hello_template = template
 
-    def connect_peer(self, peer, first=True):
+        return template.copy_to(peer.uuid, now=self.app.tick)
+
+    def connect_peer(self, peer, first=True, batch=None):
         """
         Take steps to connect a peer.
 
+        The peer becomes CONNECTING right away, under the peers lock held
+        by the caller, so a second request to connect it is ignored
+        until the attempt is resolved; code that needs the outcome can
+        wait on :py:attr:`p2p0mq.peer.Peer.connect_event`.
+
         Arguments:
             peer (Peer):
                 The peer to connect to.
             first (bool):
                 tells if this is a connect or reconnect attempt.
+            batch (list):
+                If provided, the `(peer, message)` tuple is appended here
+                instead of being handed to the sender right away.
         """
 
-        # Filter peers that we have send a connect request in previous loops
+        # Filter peers that we have send a connect request to
         # but we haven't seen a reply, yet.
-        if peer.next_heart_beat_time is not None and first:
-            logger.log(TRACE, "%s is waiting for a reply until %r",
-                       peer, peer.next_heart_beat_time)
+        if peer.conn_state == CONNECTING:
+            if logger.isEnabledFor(TRACE):
+                logger.log(TRACE, "%s is waiting for a reply until %r",
+                           peer, peer.next_heart_beat_time)
             return
 
-        # Compose the message.
-        message = Message(
-            source=self.app.uuid,
-            to=peer.uuid,
-            previous_hop=None,
-            next_hop=peer.uuid,
-            command=self.command_id,
-            reply=False,
-            handler=self,
-            host=self.app.receiver.bind_address,
-            port=self.app.receiver.bind_port,
-        )
+        # Compose the message and mark it as the one in flight.
+        message = self.compose_hello(peer)
+        peer.start_connect_attempt(message.message_id)
+        trace = logger.isEnabledFor(TRACE)
 
         if first:
             # Compute the timeout.
             peer.next_heart_beat_time = self.app.tick + UNRESPONSIVE_THRESHOLD
             peer.slow_heart_beat_down = 0
-            logger.log(TRACE, "First message composed for connect "
-                              "attempt to %s: %r; will wait until %r",
-                       peer, message, peer.next_heart_beat_time)
+            if trace:
+                logger.log(TRACE, "First message composed for connect "
+                                  "attempt to %s: %r; will wait until %r",
+                           peer, message, peer.next_heart_beat_time)
         else:
             # Take into consideration the history of the peer.
             peer.schedule_heart_beat(self.app)
-            logger.log(TRACE, "Message composed for subsequent connect "
-                              "attempt to %s: %r; will wait until %r",
-                       peer, message, peer.next_heart_beat_time)
+            if trace:
+                logger.log(TRACE, "Message composed for subsequent connect "
+                                  "attempt to %s: %r; will wait until %r",
+                           peer, message, peer.next_heart_beat_time)
 
-        # We directly enqueue the message.
-        self.app.sender.connection_queue.enqueue({peer: message})
+        if batch is None:
+            self.app.sender.enqueue_connect(peer, message)
+        else:
+            batch.append((peer, message))
 
-    def reconnect_peer(self, peer):
+    def reconnect_peer(self, peer, batch=None):
         """
         Re-attempt to connect a peer that failed before.
 
         Arguments:
             peer(Peer):
                 The peer in question.
+            batch (list):
+                Passed along to :meth:`~connect_peer`.
         """
-        if peer.next_heart_beat_time < self.app.tick:
-            self.connect_peer(peer, first=False)
-        else:
+        deadline = peer.next_heart_beat_time
+        tick = self.app.tick
+        if deadline < tick:
+            self.connect_peer(peer, first=False, batch=batch)
+        elif logger.isEnabledFor(TRACE):
             logger.log(TRACE, "Reconnect time for %s will be at %r, now is %r",
-                       peer, peer.next_heart_beat_time, self.app.tick)
+                       peer, deadline, tick)
 
-    def connecting_peer(self, peer):
+    def connecting_peer(self, peer, batch=None):
         """
         Check a peer we attempted to connect.
 
@@ -105,14 +181,19 @@ class ConnectorConcern(Concern):
         Arguments:
             peer(Peer):
                 The peer in question.
+            batch (list):
+                Not used; present so that all the
+                :py:attr:`state_handlers` have the same signature.
         """
-        if peer.next_heart_beat_time < self.app.tick:
-            self.declare_no_connection(peer)
-        else:
+        deadline = peer.next_heart_beat_time
+        tick = self.app.tick
+        if deadline < tick:
+            self.declare_no_connection(peer, tick)
+        elif logger.isEnabledFor(TRACE):
             logger.log(TRACE, "%s is connecting (has until %r, now is %r)",
-                       peer, peer.next_heart_beat_time, self.app.tick)
+                       peer, deadline, tick)
 
-    def declare_no_connection(self, peer):
+    def declare_no_connection(self, peer, tick=None):
         """
         We mark a peer as impossible to connect to.
 
@@ -122,13 +203,18 @@ class ConnectorConcern(Concern):
         Arguments:
             peer(Peer):
                 The peer in question.
+            tick (float):
+                Current time; `app.tick` is used if not provided.
         """
-        peer.state_no_connection = True
-        peer.last_heart_beat_time = self.app.tick
-        peer.next_heart_beat_time = \
-            peer.last_heart_beat_time + UNRESPONSIVE_RECONNECT_WAIT
-        logger.debug("Cannot connect to %s; will attempt again after %r",
-                     peer, peer.next_heart_beat_time)
+        if tick is None:
+            tick = self.app.tick
+        peer.conn_state = NO_CONNECTION
+        peer.end_connect_attempt()
+        peer.last_heart_beat_time = tick
+        peer.next_heart_beat_time = tick + UNRESPONSIVE_RECONNECT_WAIT
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Cannot connect to %s; will attempt again after %r",
+                         peer, peer.next_heart_beat_time)
 
     def execute(self):
         """
@@ -145,22 +231,86 @@ class ConnectorConcern(Concern):
         if the time is right.
 
         Any peer that doesn't have a `host` set is ignored.
+
+        Before that, the events reported by the sender are applied, all
+        under a single acquisition of the lock.
+
+        INITIAL peers that have a host are found through
+        :py:attr:`p2p0mq.peer_store.PeerMap.to_connect`, while
+        CONNECTING and NO_CONNECTION peers are taken out of the
+        :py:attr:`schedule` only when their time has come.
+        CONNECTING peers that timed out only need new deadlines, so they
+        are handled right away. The lock is then taken again for each
+        remaining peer and the handler for its current state is looked up
+        in :py:attr:`state_handlers`. The messages that are produced
+        are handed to the sender in a single batch at the end.
+
+        At most CONNECT_LIMIT_PER_LOOP peers are taken from each source;
+        the rest are left for next loops.
+
+        When there are no sender events, no peers to connect and
+        the schedule has nothing due the method returns without
+        taking the lock.
         """
-        with self.app.peers_lock:
-            for peer in self.app.peers.values():
+        app = self.app
+        peers = app.peers
+        tick = app.tick
+        if not self.sender_events and not peers.to_connect and \
+                not self.schedule.is_due(tick, inclusive=False):
+            return
 
-                # Skip peers that have no chance at connecting.
+        lock = app.peers_lock
+        with lock:
+            self.process_sender_events()
+
+            # Peers that have no chance at connecting are not considered.
+            initial = tuple(islice(peers.to_connect, CONNECT_LIMIT_PER_LOOP))
+
+            declare = self.declare_no_connection
+            to_reconnect = []
+            append = to_reconnect.append
+            for peer in self.schedule.pop_due(peers, tick, inclusive=False,
+                                              limit=CONNECT_LIMIT_PER_LOOP):
                 if peer.host is None:
-                    logger.log(TRACE, "%s will not be connected as it "
-                                      "doens't have a host set", peer)
                     continue
+                if peer.conn_state == CONNECTING:
+                    declare(peer, tick)
+                else:
+                    append(peer.uuid)
+
+        handlers = self.state_handlers
+        batch = []
+        for uuids in (initial, to_reconnect):
+            for uuid in uuids:
+                with lock:
+                    peer = peers.get(uuid)
+                    if peer is None or peer.host is None:
+                        continue
+
+                    # The state may have changed in the meantime, so the
+                    # handler is selected based on current state.
+                    handler = handlers.get(peer.conn_state)
+                    if handler is not None:
+                        handler(peer, batch)
+
+        if batch:
+            app.sender.enqueue_connects(batch)
+
+    @staticmethod
+    def read_address(message):
+        """
+        Extracts the address of the sender from a hello message.
 
-                if peer.state_connecting:
-                    self.connecting_peer(peer)
-                elif peer.state_initial:
-                    self.connect_peer(peer)
-                elif peer.state_no_connection:
-                    self.reconnect_peer(peer)
+        Arguments:
+            message (Message):
+                The request or the reply to inspect.
+        Returns:
+            A (host, port) tuple.
+        Raises:
+            KeyError: if the payload does not include the address.
+        """
+        payload = message.payload
+        return payload['host'], payload['port']
 
     def process_request(self, message):
         """
@@ -184,40 +334,51 @@ class ConnectorConcern(Concern):
                 The message to process.
         """
         logger.debug("Request to connect received: %s", message)
-        if message.source in self.app.peers:
-            logger.debug("I already know peer %r", message.source)
-            with self.app.peers_lock:
-                peer = self.app.peers[message.source]
-
-            logger.log(TRACE, "previous host: %r, new host: %r, "
-                              "previous port: %r, new port: %r",
-                       peer.host, message.payload['host'],
-                       peer.port, message.payload['port'])
-            peer.host = message.payload['host']
-            peer.port = message.payload['port']
-        else:
-            peer = Peer(
-                uuid=message.source,
-                host=message.payload['host'],
-                port=message.payload['port']
-            )
-            self.app.add_peer(peer)
-            logger.debug("Never heard of such peer %r", message.source)
-            logger.log(TRACE, "host: %r, port: %r",
-                       peer.host, peer.port)
-
-        peer.last_heart_beat_time = self.app.tick
-        if peer.needs_reconnect:
-            logger.debug("A connect will be attempted to %s as a result "
-                         "of this request", peer)
-            # Here we're sending our own message as there are two
-            # communication channels. The log will show two messages being
-            # sent to same host at the same time.
-            self.connect_peer(peer)
-        else:
-            peer.become_connected(message, self.app)
+        try:
+            host, port = self.read_address(message)
+        except KeyError:
+            logger.error("Malformed connect request", exc_info=True)
+            return None
+
+        app = self.app
+        trace = logger.isEnabledFor(TRACE)
+        pending = []
+        with app.peers_lock:
+            peer = app.peers.get(message.source)
+            if peer is not None:
+                logger.debug("I already know peer %r", message.source)
+                if trace:
+                    logger.log(TRACE, "previous host: %r, new host: %r, "
+                                      "previous port: %r, new port: %r",
+                               peer.host, host, peer.port, port)
+                peer.host = host
+                peer.port = port
+            else:
+                peer = Peer(uuid=message.source, host=host, port=port)
+                app.add_peer_locked(peer)
+                logger.debug("Never heard of such peer %r", message.source)
+                if trace:
+                    logger.log(TRACE, "host: %r, port: %r",
+                               peer.host, peer.port)
+
+            peer.last_heart_beat_time = app.tick
+            if peer.conn_state in RECONNECT_STATES:
+                logger.debug("A connect will be attempted to %s as a result "
+                             "of this request", peer)
+                # Here we're sending our own message as there are two
+                # communication channels. The log will show two messages
+                # being sent to same host at the same time.
+                self.connect_peer(peer, batch=pending)
+            else:
+                peer.become_connected(message, app)
+
+        # The sender is only told about the attempt after the peers
+        # lock is released.
+        if pending:
+            app.sender.enqueue_connects(pending)
 
         return SPEED_FAST, message.create_reply(
+            now=app.tick,
             host=self.app.receiver.bind_address,
             port=self.app.receiver.bind_port,
         )
@@ -229,59 +390,95 @@ class ConnectorConcern(Concern):
         This is the handler on the sender side for connect requests.
         We update the details based on the information in the reply and
         change state of the peer to either CONNECTED or ROUTED
-        depending on the path the message has arrived on.
+        depending on the path the message has arrived on. The lookup
+        and the changes are done in a single critical section.
 
         Arguments:
             message (Message):
                 The message to process.
         """
         logger.debug("Reply for connect received: %s", message)
-        with self.app.peers_lock:
-            try:
-                peer = self.app.peers[message.source]
-            except KeyError:
+        try:
+            host, port = self.read_address(message)
+        except KeyError:
+            logger.error("Malformed connect reply", exc_info=True)
+            return
+
+        app = self.app
+        with app.peers_lock:
+            peer = app.peers.get(message.source)
+            if peer is None:
                 logger.error("Connect response to a peer we've never "
                              "seen before: %r", message)
                 return
 
-        logger.log(TRACE, "previous host: %r, new host: %r, "
-                          "previous port: %r, new port: %r",
-                   peer.host, message.payload['host'],
-                   peer.port, message.payload['port'])
-        peer.host = message.payload['host']
-        peer.port = message.payload['port']
-        peer.become_connected(message, self.app)
+            if logger.isEnabledFor(TRACE):
+                logger.log(TRACE, "previous host: %r, new host: %r, "
+                                  "previous port: %r, new port: %r",
+                           peer.host, host, peer.port, port)
+            peer.host = host
+            peer.port = port
+            peer.become_connected(message, app)
 
     def send_failed(self, message, exc=None):
         """
         We are informed that one of our messages failed to send.
 
-        This call is made in the context of the sending thread.
+        This call is made in the context of the sending thread; the event
+        is recorded and the peer is updated by :meth:`~execute`.
 
         .. warning::
            As the handling of this message is special (
            see :meth:`p2p0mq.app.client.Sender.connect_peers`) this
            method is prohibited from re-issuing a message by returning it.
         """
-        with self.app.peers_lock:
-            self.declare_no_connection(self.app.peers[message.to])
+        self.sender_events.append(
+            (self.declare_no_connection, message.to, message.message_id))
         return None
 
     def message_sent(self, message):
         """
         We are informed that one of our messages was sent.
 
-        This call is made in the context of the sending thread.
+        The peer is already in CONNECTING state so there's nothing to
+        update; the reply or the timeout will decide its fate.
         """
-        with self.app.peers_lock:
-            peer = self.app.peers[message.to]
-            peer.state_connecting = True
+        if logger.isEnabledFor(TRACE):
+            logger.log(TRACE, "Hello message %r has left for %r",
+                       message.message_id, message.to)
 
     def message_dropped(self, message):
         """
         We are informed that one of our messages was dropped.
 
-        This call is made in the context of the sending thread.
+        This call is made in the context of the sending thread; the event
+        is recorded and the peer is updated by :meth:`~execute`.
         """
-        with self.app.peers_lock:
-            self.declare_no_connection(self.app.peers[message.to])
+        self.sender_events.append(
+            (self.declare_no_connection, message.to, message.message_id))
+
+    def process_sender_events(self):
+        """
+        Applies the events recorded by the sending thread.
+
+        Events about a message that is no longer the one in flight
+        for its peer (the peer was connected or a new attempt was made
+        in the meantime) are stale and are ignored.
+
+        The caller is expected to hold the peers lock.
+        """
+        events = self.sender_events
+        peers = self.app.peers
+        while events:
+            handler, uuid, message_id = events.popleft()
+            peer = peers.get(uuid)
+            if peer is None:
+                logger.debug("Sender event for unknown peer %r", uuid)
+                continue
+            if peer.connect_id != message_id:
+                if logger.isEnabledFor(TRACE):
+                    logger.log(TRACE, "Stale sender event for %s (message "
+                                      "%r, in flight %r)",
+                               peer, message_id, peer.connect_id)
+                continue
+            handler(peer)
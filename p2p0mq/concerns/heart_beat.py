@@ -10,10 +10,10 @@ from p2p0mq.concerns.base import Concern
 from p2p0mq.constants import (
     HEART_BEAT_INTERVAL, TRACE, SPEED_FAST, UNRESPONSIVE_THRESHOLD,
     NO_CONNECTION_THRESHOLD, HEART_BEAT_MAX_INTERVAL,
-    HEART_BEAT_SLOW_DOWN
+    HEART_BEAT_SLOW_DOWN, HEART_BEAT_LIMIT_PER_LOOP
 )
 from p2p0mq.message import Message
-from p2p0mq.peer import Peer
+from p2p0mq.peer import Peer, CONNECTED, ROUTED, UNREACHABLE, NO_CONNECTION
 
 logger = logging.getLogger('p2p0mq.concern.hb')
 
@@ -21,11 +21,40 @@ logger = logging.getLogger('p2p0mq.concern.hb')
 class HeartBeatConcern(Concern):
     """
     Manages the heart-beat signal between peers.
+
+    Attributes:
+        heart_beat_template (Message):
+            The request that is copied for each peer; it is
+            created the first time it is needed.
+        messages_buffer (list):
+            The list where :meth:`~execute` collects the requests; it is
+            emptied after the requests are handed to the sender (which
+            copies them), so the same list is used in each loop.
+        schedule (PeerSchedule):
+            The CONNECTED, ROUTED and UNREACHABLE peers ordered by
+            their heart-beat time; created when the concern is started.
     """
     def __init__(self, *args, **kwargs):
         """ Constructor. """
         super(HeartBeatConcern, self).__init__(
             name="heart-beat", command_id=b'hb', *args, **kwargs)
+        self.heart_beat_template = None
+        self.messages_buffer = []
+        self.schedule = None
+
+    def start(self):
+        """ Starts tracking the heart-beat time of the peers. """
+        self.heart_beat_template = None
+        with self.app.peers_lock:
+            self.schedule = self.app.peers.add_schedule(
+                (CONNECTED, ROUTED, UNREACHABLE))
+
+    def terminate(self):
+        """ Stops tracking the heart-beat time of the peers. """
+        if self.schedule is not None:
+            with self.app.peers_lock:
+                self.app.peers.remove_schedule(self.schedule)
+            self.schedule = None
 
     def compose_heart_beat_request(self, peer):
         """
@@ -35,15 +64,21 @@ class HeartBeatConcern(Concern):
             peer (Peer):
                 The peer we should send the message to.
         """
-        return Message(
-            source=self.app.uuid,
-            to=peer.uuid,
-            previous_hop=None,
-            next_hop=peer.uuid if peer.state_connected else peer.via,
-            command=self.command_id,
-            reply=False,
-            handler=self,
-        )
+        template = self.heart_beat_template
+        if template is None:
+            template = Message(
+                source=self.app.uuid,
+                previous_hop=None,
+                command=self.command_id,
+                reply=False,
+                handler=self,
+            )
+            self.heart_beat_template = template
+
+        return template.copy_to(
+            peer.uuid,
+            peer.uuid if peer.conn_state == CONNECTED else peer.via,
+            now=self.app.tick)
 
     def execute(self):
         """
@@ -51,20 +86,39 @@ class HeartBeatConcern(Concern):
 
         We go through each CONNECTED, ROUTED or UNREACHABLE peer and send a
         heart beat message if the timeout has been reached.
+
+        Only the peers whose time has come are taken out of the
+        :py:attr:`schedule`, so the cost does not depend on the number
+        of peers that are not due. When no peer is due the
+        lock is not even taken. At most HEART_BEAT_LIMIT_PER_LOOP peers
+        are handled in a call; the rest are left for next loops.
+        The handled peers are put back in the schedule all at once
+        (see :meth:`p2p0mq.peer_store.PeerMap.deferred_reschedule`).
         """
-        messages = []
-        with self.app.peers_lock:
-            for peer in self.app.peers.values():
-                if peer.does_heart_beat:
-                    if peer.next_heart_beat_time <= self.app.tick:
-                        self.expired_peer(peer, messages)
+        app = self.app
+        tick = app.tick
+        schedule = self.schedule
+        if not schedule.is_due(tick):
+            return
 
-        logger.log(TRACE, "%d messages to enqueue: %r",
-                   len(messages), messages)
-        if len(messages):
-            self.app.sender.enqueue_fast(messages)
+        messages = self.messages_buffer
+        expired = self.expired_peer
+        with app.peers_lock:
+            peers = app.peers
+            with peers.deferred_reschedule():
+                for peer in schedule.pop_due(peers, tick,
+                                             limit=HEART_BEAT_LIMIT_PER_LOOP):
+                    expired(peer, messages, tick)
+        if logger.isEnabledFor(TRACE):
+            logger.log(TRACE, "%d messages to enqueue: %r",
+                       len(messages), messages)
+        if messages:
+            try:
+                app.sender.enqueue_fast(messages)
+            finally:
+                messages.clear()
 
-    def expired_peer(self, peer, messages):
+    def expired_peer(self, peer, messages, tick=None):
         """
         A peer that has passed it's heart-beat time.
 
@@ -79,20 +133,38 @@ class HeartBeatConcern(Concern):
         UNRESPONSIVE peers are only sent heart beat messages until they
         exit this state.
 
+        CONNECTED peers that handed us a message during last
+        heart-beat interval are not asked for a heart beat; that
+        message counts as one.
+
         Arguments:
             peer (Peer):
                 The peer whose heart-beat timeout has expired.
             messages (list):
                 The list where we append any messages we decide need sending.
+            tick (float):
+                Current time; `app.tick` is used if not provided.
         """
-        if peer.last_heart_beat_time + NO_CONNECTION_THRESHOLD < self.app.tick:
-            peer.state_no_connection = True
+        app = self.app
+        if tick is None:
+            tick = app.tick
+        last_rx_time = peer.last_rx_time
+        if last_rx_time is not None and \
+                tick - last_rx_time < HEART_BEAT_INTERVAL and \
+                peer.conn_state == CONNECTED:
+            peer.last_heart_beat_time = last_rx_time
+            peer.slow_heart_beat_down = 0
+            peer.next_heart_beat_time = last_rx_time + HEART_BEAT_INTERVAL
             return
 
-        if peer.last_heart_beat_time + UNRESPONSIVE_THRESHOLD < self.app.tick:
-            peer.state_unreachable = True
+        silence = peer.time_since_heart_beat(tick)
+        if silence > NO_CONNECTION_THRESHOLD:
+            peer.conn_state = NO_CONNECTION
+            return
+        elif silence > UNRESPONSIVE_THRESHOLD:
+            peer.conn_state = UNREACHABLE
 
-        peer.schedule_heart_beat(self.app)
+        peer.schedule_heart_beat(app, tick)
         messages.append(self.compose_heart_beat_request(peer))
 
     def process_request(self, message):
@@ -116,7 +188,7 @@ class HeartBeatConcern(Concern):
                 return
 
             peer.become_connected(message, self.app)
-        return SPEED_FAST, message.create_reply()
+        return SPEED_FAST, message.create_reply(now=self.app.tick)
 
     def process_reply(self, message):
         """
@@ -122,12 +122,15 @@ For peers in initial state (those we never attempted to
 connect before) that also have a host set we create a
 message where we also set our connection parameters.
 
-The INITIAL state of the peer becomes CONNECTING only when we are
-informed in :meth:`~p2p0mq.concerns.connector.ConnectorConcern.message_sent`
-that we were able to send the message. If we get
+The INITIAL state of the peer becomes CONNECTING as soon as the message
+is handed to the sender and the id of the message is remembered in the peer,
+so a second attempt is not made while this one is in flight. If we get
 a failure via :meth:`~p2p0mq.concerns.connector.ConnectorConcern.send_failed` or
 :meth:`~p2p0mq.concerns.connector.ConnectorConcern.message_dropped` the
-state of the peer is set to NO_CONNECTION.
+state of the peer is set to NO_CONNECTION. These notifications arrive in
+the sending thread, so they are only recorded there; the peers are updated
+on the next execute step in the application thread, unless
+the notification is about an older message.
 
 For peers in CONNECTING state (message sent but reply did not arrive),
 it the timeout has been exceeded, we also set the NO_CONNECTION state.
@@ -176,6 +179,7 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+from time import monotonic
 
 from p2p0mq.concerns.connector import ConnectorConcern
 from p2p0mq.constants import TRACE_NET, SPEED_SLOW, SPEED_MEDIUM, SPEED_FAST, PROCESS_LIMIT_PER_LOOP, ISOLATE, TRACE
@@ -191,20 +195,84 @@ class ConcernsManager(object):
     Attributes:
         concerns (dict):
             The list of :class:`concerns <p2p0mq.concerns.base.Concern>`
-            we know about, indexed by their `command_id`.
+            we know about, indexed by their `command_id`. Add concerns
+            with :meth:`~add_concern` or assign a new dictionary;
+            changing the dictionary in place leaves the dispatch tables
+            below out of date.
         concerns_started (bool):
             Flag to tell if the start method has been called.
             This is used to determine who's responsibility it is to
             call :meth:`~p2p0mq.concerns.base.Concern.start` on
             newly added concerns.
+        request_dispatch (dict):
+            Maps the `command_id` of each concern to a tuple
+            consisting of the concern and its bound
+            :meth:`~p2p0mq.concerns.base.Concern.process_request` method.
+        reply_dispatch (dict):
+            Maps the `command_id` of each concern to a tuple
+            consisting of the concern and its bound
+            :meth:`~p2p0mq.concerns.base.Concern.process_reply` method.
+        execution_order (tuple):
+            The concerns, each paired with its bound
+            :meth:`~p2p0mq.concerns.base.Concern.execute` method,
+            in the order they are executed on each loop.
+        trace_enabled (bool):
+            Cached result of checking if the TRACE level is enabled for
+            the logger of this module (see :meth:`~update_log_levels`).
+        trace_net_enabled (bool):
+            Same as :py:attr:`trace_enabled` for the TRACE_NET level.
     """
     def __init__(self, *args, **kwargs):
         """ Constructor. """
         super(ConcernsManager, self).__init__(*args, **kwargs)
 
         # These are plugins that are hooked up into the local peer events.
-        self.concerns = {}
+        self.request_dispatch = {}
+        self.reply_dispatch = {}
+        self.execution_order = ()
+        self._concerns = {}
         self.concerns_started = False
+        self.trace_enabled = False
+        self.trace_net_enabled = False
+        self.update_log_levels()
+
+    def update_log_levels(self):
+        """
+        Caches the levels that are enabled for the logger of this module.
+
+        The hot loops consult the cached flags instead of the logger.
+        The method is called at construction time and when concerns are
+        started; call it again if logging configuration changes later.
+        """
+        self.trace_enabled = logger.isEnabledFor(TRACE)
+        self.trace_net_enabled = logger.isEnabledFor(TRACE_NET)
+
+    @property
+    def concerns(self):
+        """ The concerns we know about, indexed by their `command_id`. """
+        return self._concerns
+
+    @concerns.setter
+    def concerns(self, value):
+        self._concerns = value
+        self.rebuild_dispatch()
+
+    def rebuild_dispatch(self):
+        """ Builds the dispatch tables from the list of concerns. """
+        self.request_dispatch = {}
+        self.reply_dispatch = {}
+        self.execution_order = ()
+        for concern in self._concerns.values():
+            self.update_dispatch(concern)
+
+    def update_dispatch(self, concern):
+        """ Adds the handlers of a concern to the dispatch tables. """
+        self.request_dispatch[concern.command_id] = (
+            concern, concern.process_request)
+        self.reply_dispatch[concern.command_id] = (
+            concern, concern.process_reply)
+        self.execution_order = self.execution_order + (
+            (concern, concern.execute),)
 
     def add_concern(self, concern):
         """
@@ -215,8 +283,9 @@ class ConcernsManager(object):
                 The new concern to add. It is asserted that the command id is
                 not present in the dictionary.
         """
-        assert concern.command_id not in self.concerns
-        self.concerns[concern.command_id] = concern
+        assert concern.command_id not in self._concerns
+        self._concerns[concern.command_id] = concern
+        self.update_dispatch(concern)
         concern.app = self
         if self.concerns_started:
             concern.start()
@@ -258,6 +327,11 @@ class ConcernsManager(object):
                              "(it is added automatically only if the "
                              "list of concerns is empty at startup)")
 
+        self.update_log_levels()
+
+        # The dictionary of concerns may have been changed in place.
+        self.rebuild_dispatch()
+
         for concern in self.concerns.values():
             logger.debug("Concern %s is being started", concern)
             concern.start()
@@ -283,9 +357,23 @@ class ConcernsManager(object):
 
         Called on each execute step by the local peer.
         Call each concern's execute method in turn.
+
+        Calls that exceed the
+        :py:attr:`~p2p0mq.concerns.base.Concern.execute_budget` of the
+        concern are reported.
         """
-        for concern in self.concerns.values():
-            concern.execute()
+        for concern, execute in self.execution_order:
+            budget = concern.execute_budget
+            if budget is None:
+                execute()
+                continue
+
+            start = monotonic()
+            execute()
+            elapsed = monotonic() - start
+            if elapsed > budget:
+                logger.warning("%s took %.3f seconds to execute "
+                               "(budget is %.3f)", concern, elapsed, budget)
 
     def process_requests(self, queue):
         """
@@ -311,65 +399,80 @@ class ConcernsManager(object):
         """
         Called on the local peer thread to process requests and replies.
         """
-        logger.log(TRACE, "Processing %s queue", label)
-
-        results = {
-            SPEED_SLOW: [],
-            SPEED_MEDIUM: [],
-            SPEED_FAST: [],
+        trace = self.trace_enabled
+        trace_net = self.trace_net_enabled
+        if trace:
+            logger.log(TRACE, "Processing %s queue", label)
+        lookup = (self.reply_dispatch if reply else self.request_dispatch).get
+
+        slow = []
+        medium = []
+        fast = []
+        appenders = {
+            SPEED_SLOW: slow.append,
+            SPEED_MEDIUM: medium.append,
+            SPEED_FAST: fast.append,
         }
 
-        for i in range(PROCESS_LIMIT_PER_LOOP):
-            messages = queue.dequeue()
-            if len(messages) == 0:
-                logger.log(TRACE, "No %s to process; early exit", label)
-                break
+        messages = queue.dequeue_many(PROCESS_LIMIT_PER_LOOP)
+        if messages:
+            self.note_traffic(messages, self.tick)
+        elif trace:
+            logger.log(TRACE, "No %s to process", label)
 
-            for message in messages:
-                logger.log(TRACE,
-                           "concerns handler received %s: %r",
+        for message in messages:
+            if trace:
+                logger.log(TRACE, "concerns handler received %s: %r",
                            label, message)
 
-                # Locate the concern.
-                try:
-                    concern = self.concerns[message.command]
-                except KeyError:
-                    logger.error("Received unknown %s %r",
-                                 label, message.command)
-                    logger.debug("Offending message was: %r", message)
-                    continue
-                message.handler = concern
-
-                # Call the concern's handler.
-                # noinspection PyBroadException
-                try:
+            # Locate the concern.
+            handler = lookup(message.command)
+            if handler is None:
+                logger.error("Received unknown %s %r",
+                             label, message.command)
+                logger.debug("Offending message was: %r", message)
+                continue
+            concern, handler = handler
+            message.handler = concern
+
+            # Call the concern's handler.
+            # noinspection PyBroadException
+            try:
+                if trace:
                     logger.log(TRACE, "Call the concern's handler")
-
-                    if reply:
-                        result = concern.process_reply(message)
-                    else:
-                        result = concern.process_request(message)
-                except (KeyboardInterrupt, SystemExit):
-                    raise
-                except Exception:
-                    logger.error("Exception while processing %s %r",
-                                 label, message.command)
-                    logger.debug("Offending message was: %r",
-                                 message, exc_info=True)
-                    continue
-
-                # We can send the message if there is one.
-                if result is None:
+                result = handler(message)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception:
+                logger.error("Exception while processing %s %r",
+                             label, message.command)
+                logger.debug("Offending message was: %r",
+                             message, exc_info=True)
+                continue
+
+            # We can send the message if there is one.
+            if result is None:
+                if trace_net:
                     logger.log(TRACE_NET,
                                "no response will be send for this %s",
                                label)
-                    continue
+                continue
 
-                priority, result = result
+            priority, result = result
+            if trace_net:
                 logger.log(TRACE_NET,
                            "response send for this %s will be %r",
                            label, result)
 
-                results[priority].append(result)
-
-        return results
+            try:
+                append = appenders[priority]
+            except KeyError:
+                raise ValueError("Concern %s returned an unknown "
+                                 "priority %r" % (concern, priority))
+            append(result)
+
+        return {
+            SPEED_SLOW: slow,
+            SPEED_MEDIUM: medium,
+            SPEED_FAST: fast,
+        }
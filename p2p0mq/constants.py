@@ -69,5 +69,26 @@ LOOP_END = False
 RECEIVE_LIMIT_PER_LOOP = 10
 # The maximum number of messages the local peer processes in a loop.
 PROCESS_LIMIT_PER_LOOP = RECEIVE_LIMIT_PER_LOOP + 2
+# The maximum number of peers the connector acts upon in a loop.
+CONNECT_LIMIT_PER_LOOP = 64
+# The maximum number of heart-beat requests composed in a loop.
+HEART_BEAT_LIMIT_PER_LOOP = 256
+# The number of seconds a concern is expected to spend in an execute call;
+# longer calls are reported in the log.
+EXECUTE_BUDGET = 0.1
 # The maximum number of seconds to wait for th application to stabilize.
 STABILIZE_TIMEOUT = 8
+
+# ---- Database ----
+# How hard sqlite works to make a commit durable (`PRAGMA synchronous`);
+# with the WAL journal NORMAL only risks the last commits on power loss.
+DB_SYNC_LEVEL = 'NORMAL'
+# The number of seconds a connection waits for a lock held by another one.
+DB_BUSY_TIMEOUT = 5
+
+# ---- Security ----
+# The maximum number of certificate files whose keys are kept in memory.
+CERT_KEY_CACHE_SIZE = 1024
+# The maximum number of certificate paths remembered before they are
+# all computed again.
+CERT_FILE_CACHE_SIZE = 1024
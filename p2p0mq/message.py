@@ -5,28 +5,71 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+from itertools import count
 from time import time
 
-from umsgpack import packb, unpackb
+try:
+    # The C implementation of msgpack is used when available; the wire
+    # format is the same as the one produced by umsgpack.
+    import msgpack
+except ImportError:
+    msgpack = None
+    from umsgpack import packb, unpackb, UnpackException
+else:
+    from msgpack.exceptions import UnpackException
+
+    def packb(obj):
+        """ Encodes an object (bytes and strings remain distinct). """
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def unpackb(data):
+        """ Decodes an object encoded by :func:`packb`.
+
+        Like umsgpack, map keys of any hashable type are accepted.
+        """
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
 
 from p2p0mq.constants import MESSAGE_TYPE_REPLY, MESSAGE_TYPE_REQUEST, DEFAULT_TIME_TO_LIVE
 from p2p0mq.errors import MessageValidationError
 
 logger = logging.getLogger('p2p0mq.message')
 
-next_message_id = 0
+# The message id and the payload travel together in the last frame
+# as a msgpack array with two elements; this is the header of the array.
+BODY_HEADER = b'\x92'
 
+# The frame that carries the kind of the message, built once for each
+# possible value of the byte.
+KIND_FRAMES = tuple(bytes([kind]) for kind in range(256))
 
-def get_next_message_id():
-    global next_message_id
-    next_message_id = next_message_id + 1
-    return next_message_id
+# Allocates message ids; the increment happens in C, so it is
+# also safe to call from several threads.
+get_next_message_id = count(1).__next__
 
 
 class Message(object):
     """
     A message we send down the wire.
+
+    On the wire a message consists of six frames: the next hop (consumed
+    by the ROUTER socket), the source, the destination, the kind, the
+    command and the body, which packs the message id and the payload
+    together.
+
+    The encoded form of the payload and of the body is cached:
+    it is computed the first time the message is encoded, or it is
+    taken from the wire when the message is parsed, so relayed
+    messages and copies of template messages are not packed again.
+    Assigning a new payload or message id discards the cached value;
+    the payload should not be changed in place after the message
+    has been encoded.
     """
+    __slots__ = (
+        'source', 'to', 'previous_hop', 'next_hop', 'command', 'handler',
+        'kind', '_payload', '_packed_payload', 'time_to_live',
+        '_message_id', '_packed_body',
+    )
+
     def __init__(self,
                  source=None, to=None,
                  previous_hop=None,
@@ -36,8 +79,17 @@ class Message(object):
                  handler=None,
                  message_id=None,
                  time_to_live=DEFAULT_TIME_TO_LIVE,
+                 payload=None,
+                 now=None,
                  **kwargs):
-        """ Constructor. """
+        """ Constructor.
+
+        The payload is either given as a dictionary in `payload`
+        (which is used as it is, without copying it) or as
+        keyword arguments. The time to live is relative to `now`,
+        which callers that know the current time (usually `app.tick`)
+        can provide; `time()` is used otherwise.
+        """
         super(Message, self).__init__()
         self.source = source
         self.to = to
@@ -49,9 +101,76 @@ class Message(object):
             self.kind = MESSAGE_TYPE_REPLY if reply else MESSAGE_TYPE_REQUEST
         else:
             self.kind = reply
-        self.payload = dict(kwargs)
-        self.time_to_live = time() + time_to_live
-        self.message_id = message_id if message_id else get_next_message_id()
+        self._payload = payload if payload is not None else kwargs
+        self._packed_payload = None
+        self._packed_body = None
+        self.time_to_live = \
+            (now if now is not None else time()) + time_to_live
+        self._message_id = \
+            message_id if message_id else get_next_message_id()
+
+    def __copy__(self):
+        """ Creates a shallow copy of this message.
+
+        The copy shares the payload with the original, so it should be
+        used with messages that act as templates for other messages.
+        """
+        result = Message.__new__(Message)
+        result.source = self.source
+        result.to = self.to
+        result.previous_hop = self.previous_hop
+        result.next_hop = self.next_hop
+        result.command = self.command
+        result.handler = self.handler
+        result.kind = self.kind
+        result._payload = self._payload
+        result._packed_payload = self._packed_payload
+        result.time_to_live = self.time_to_live
+        result._message_id = self._message_id
+        result._packed_body = self._packed_body
+        return result
+
+    @property
+    def payload(self):
+        """ The content of the message (a dictionary). """
+        return self._payload
+
+    @payload.setter
+    def payload(self, value):
+        self._payload = value
+        self._packed_payload = None
+        self._packed_body = None
+
+    @property
+    def message_id(self):
+        """ Identifies the message; replies have the same id as
+        the request. """
+        return self._message_id
+
+    @message_id.setter
+    def message_id(self, value):
+        self._message_id = value
+        self._packed_body = None
+
+    def copy_to(self, to, next_hop=None, time_to_live=DEFAULT_TIME_TO_LIVE,
+                now=None):
+        """ Creates a new message based on this one (used as a template).
+
+        The copy gets its own message id and time to live and is
+        addressed to `to` through `next_hop` (which defaults to `to`).
+        The payload is shared with the template and it is encoded
+        only once, for all the copies. The time to live is relative
+        to `now` (`time()` if not provided).
+        """
+        if self._packed_payload is None:
+            self._packed_payload = packb(self._payload)
+        result = self.__copy__()
+        result.to = to
+        result.next_hop = to if next_hop is None else next_hop
+        result.message_id = get_next_message_id()
+        result.time_to_live = \
+            (now if now is not None else time()) + time_to_live
+        return result
 
     def __str__(self):
         return 'Message(to=%r, src=%r, cmd=%r, message_id=%r)' % (
@@ -83,6 +202,8 @@ class Message(object):
                      handler=None,
                      message_id=None,
                      time_to_live=DEFAULT_TIME_TO_LIVE,
+                     payload=None,
+                     now=None,
                      **kwargs):
         """ Creates a reply to the sender of this message. """
         result = Message(
@@ -94,9 +215,11 @@ class Message(object):
             reply=reply,
             handler=handler if handler is not None else self.handler,
             message_id=message_id if message_id else self.message_id,
+            time_to_live=time_to_live,
+            payload=payload,
+            now=now,
             **kwargs
         )
-        result.time_to_live = time() + time_to_live
         return result
 
     def encode(self, app_uuid):
@@ -110,41 +233,69 @@ class Message(object):
         if self.source is None:
             self.source = app_uuid
 
-        # TODO: BUG self.to if self.to != self.to else b''
+        body = self._packed_body
+        if body is None:
+            packed_payload = self._packed_payload
+            if packed_payload is None:
+                packed_payload = packb(self._payload)
+                self._packed_payload = packed_payload
+            body = BODY_HEADER + packb(self._message_id) + packed_payload
+            self._packed_body = body
+
         return \
             self.next_hop, \
             self.source if self.source != app_uuid else b'', \
             self.to if self.to != self.next_hop else b'', \
-            bytes([self.kind]), \
+            KIND_FRAMES[self.kind], \
             self.command, \
-            packb(self.message_id), \
-            packb(self.payload)
+            body
 
     @staticmethod
     def parse(raw_data, app_uuid):
-        if len(raw_data) != 7:
+        if len(raw_data) != 6:
             logger.error("Received malformed message (%d parts)",
                          len(raw_data))
             logger.debug("Offending message was: %r", raw_data)
             return None
 
-        message = Message(
-            next_hop=None,
-            previous_hop=raw_data[0],
-            source=raw_data[1] if len(raw_data[1]) != 0 else raw_data[0],
-            to=raw_data[2] if len(raw_data[2]) != 0 else app_uuid,
-            reply=raw_data[3][0],
-            command=raw_data[4],
-            message_id=unpackb(raw_data[5]),
-        )
-        message.payload = unpackb(raw_data[6])
+        body = raw_data[5]
+        try:
+            message_id, payload = unpackb(body)
+        except (TypeError, ValueError, UnpackException):
+            logger.error("Received malformed message body")
+            logger.debug("Offending message was: %r", raw_data)
+            return None
+
+        # Every received message goes through here, so the slots are
+        # filled in directly instead of going through the constructor.
+        message = Message.__new__(Message)
+        previous_hop = raw_data[0]
+        message.previous_hop = previous_hop
+        message.next_hop = None
+        message.source = raw_data[1] or previous_hop
+        message.to = raw_data[2] or app_uuid
+        message.kind = raw_data[3][0]
+        message.command = raw_data[4]
+        message.handler = None
+        message._payload = payload if payload is not None else {}
+        message._packed_payload = None
+        message.time_to_live = time() + DEFAULT_TIME_TO_LIVE
+        message._message_id = message_id
+
+        # Keep the encoded form in case the message is relayed.
+        message._packed_body = body
         return message
 
     def valid_for_send(self, app, verbose=True):
         """
         Makes sure that this message has required fields for
         sending it by the sender.
+
+        The checks are skipped if the application has its
+        `skip_validation` attribute set.
         """
+        if getattr(app, 'skip_validation', False):
+            return True
         if verbose:
             if self.to is None:
                 logger.error("`to` field is not filled in")
@@ -176,29 +327,31 @@ class Message(object):
                              self.time_to_live, app.tick)
                 return False
             return True
-        else:
-            return (
-                    (self.to is not None) and
-                    # (self.next_hop is not None) and
-                    (self.source is not None) and
-                    (self.command is not None) and
-                    (self.handler is not None) and
-                    (self.kind is not None) and
-                    (self.message_id is not None) and
-                    (self.time_to_live is not None) and
-                    (self.time_to_live >= app.tick)
-            )
+        # A single expression; it stops at the first missing field.
+        time_to_live = self.time_to_live
+        return not (
+            self.to is None or
+            self.source is None or
+            self.command is None or
+            self.handler is None or
+            self.kind is None or
+            self._message_id is None or
+            time_to_live is None
+        ) and time_to_live >= app.tick
 
     @staticmethod
     def validate_messages_for_send(message, app):
         """
         Makes sure that one or more messages have required fields for
         sending them by the sender.
+
+        The first invalid message ends the check.
         """
+        if getattr(app, 'skip_validation', False):
+            return True
         if isinstance(message, (list, tuple, set)):
-            result = True
             for m_one in message:
-                result = result and m_one.valid_for_send(app)
-        else:
-            result = message.valid_for_send(app)
-        return result
+                if not m_one.valid_for_send(app):
+                    return False
+            return True
+        return message.valid_for_send(app)
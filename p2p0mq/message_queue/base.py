@@ -32,6 +32,17 @@ class MessageQueue(object):
         """ Returns a list of messages that should be send. """
         raise NotImplementedError
 
+    def dequeue_many(self, limit):
+        """ Returns a list with the messages that would be returned by
+        up to `limit` calls to :meth:`~dequeue`. """
+        result = []
+        for i in range(limit):
+            messages = self.dequeue()
+            if len(messages) == 0:
+                break
+            result.extend(messages)
+        return result
+
     def empty(self):
         """Tell if this queue is empty"""
         raise NotImplementedError
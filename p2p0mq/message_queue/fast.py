@@ -28,7 +28,7 @@ class FastMessageQueue(MessageQueue):
         """ Adds a message to internal queue to be send later. """
         with self.lock:
             if isinstance(message, (list, set, tuple)):
-                self.queue = self.queue + list(message)
+                self.queue.extend(message)
                 logger.log(TRACE, "%d message(s) added to %s: %r",
                            len(message), self, message)
             else:
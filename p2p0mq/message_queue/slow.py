@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+from collections import deque
 
 from p2p0mq.constants import TRACE
 from .base import MessageQueue
@@ -16,13 +17,17 @@ class SlowMessageQueue(MessageQueue):
     """
     Queue that sends one message per loop.
 
-    The queue hosts a single list; it puts new messages at the end
-    of the list. A single message is chosen on each loop to be send.
+    The queue hosts a single double-ended queue; it puts new messages at
+    the end and takes them from the front, both in constant time.
+    A single message is chosen on each loop to be send.
+
+    The receiver uses these queues to hand the messages it has received
+    to the local peer thread (a single producer and a single consumer).
     """
     def __init__(self, *args, **kwargs):
         """ Constructor. """
         super(SlowMessageQueue, self).__init__(*args, **kwargs)
-        self.queue = []
+        self.queue = deque()
 
     def enqueue(self, message):
         """ Adds one or more messages to internal queue to be send later. """
@@ -35,10 +40,27 @@ class SlowMessageQueue(MessageQueue):
                 self.queue.append(message)
                 logger.log(TRACE, "1 message added to %s: %r", self, message)
 
+    def enqueue_pair(self, first, second):
+        """ Adds a `(first, second)` tuple as a single entry. """
+        with self.lock:
+            self.queue.append((first, second))
+        logger.log(TRACE, "1 pair added to %s: %r, %r", self, first, second)
+
     def dequeue(self):
         """ Returns a list of messages that should be send. """
         with self.lock:
-            result = [self.queue.pop(0)] if len(self.queue) > 0 else []
+            result = [self.queue.popleft()] if len(self.queue) > 0 else []
+        logger.log(TRACE, "%d message(s) de-queued from %s: %r",
+                   len(result), self, result)
+        return result
+
+    def dequeue_many(self, limit):
+        """ Returns up to `limit` messages, locking the queue once. """
+        with self.lock:
+            queue = self.queue
+            count = min(limit, len(queue))
+            popleft = queue.popleft
+            result = [popleft() for i in range(count)]
         logger.log(TRACE, "%d message(s) de-queued from %s: %r",
                    len(result), self, result)
         return result
@@ -51,7 +73,7 @@ class SlowMessageQueue(MessageQueue):
         return 'SlowMessageQueue(%r)' % len(self.queue)
 
     def __repr__(self):
-        return 'SlowMessageQueue(%r)' % self.queue
+        return 'SlowMessageQueue(%r)' % list(self.queue)
 
     def __len__(self):
         return len(self.queue)
@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+import threading
 
 from p2p0mq.constants import HEART_BEAT_INTERVAL, HEART_BEAT_MAX_INTERVAL, HEART_BEAT_SLOW_DOWN
 
@@ -28,6 +29,20 @@ UNREACHABLE = -1
 # Unreachable peers will decay to this state after some time.
 NO_CONNECTION = -2
 
+# The states where a connect attempt should be made.
+RECONNECT_STATES = frozenset((INITIAL, NO_CONNECTION, UNREACHABLE))
+# The states where heart-beats are sent to the peer.
+HEART_BEAT_STATES = frozenset((CONNECTED, ROUTED, UNREACHABLE))
+# The printable name of each state.
+STATE_NAMES = {
+    INITIAL: 'INITIAL',
+    CONNECTING: 'CONNECTING',
+    CONNECTED: 'CONNECTED',
+    ROUTED: 'ROUTED',
+    UNREACHABLE: 'UNREACHABLE',
+    NO_CONNECTION: 'NO CONNECTION',
+}
+
 
 class Peer(object):
     """
@@ -66,6 +81,9 @@ class Peer(object):
             The time when next heart beat has been scheduled.
         last_heart_beat_time:
             Last time we have received a heart beat from this peer.
+        last_rx_time:
+            Last time this peer handed us a message (of any kind);
+            recent traffic makes heart beats unnecessary.
         slow_heart_beat_down:
             When we're not seeing replies from a peer we gradually
             increase the time between heart beats. This parameter
@@ -74,8 +92,34 @@ class Peer(object):
             Next time when we're going to ask peers about this peer.
         last_ask_around_time:
             Last time we have asked about this peer.
+        peer_map:
+            The :class:`~p2p0mq.peer_store.PeerMap` this peer belongs to
+            (if any); it is informed about changes in connection state,
+            in heart-beat time and about the host being set or cleared.
+        connect_id:
+            The message id of the hello message that is in flight towards
+            this peer, if any; outcomes reported for other messages
+            are stale and are ignored.
+        connect_event (threading.Event):
+            Created when a connect attempt starts and set when that
+            attempt ends, either because the peer answered or because
+            we gave up; code that needs to know the outcome can
+            wait on it.
+        schedule_id:
+            Identifies the current entry of this peer in the schedules
+            of the peer map (see :class:`~p2p0mq.peer_store.PeerSchedule`).
 
     """
+    __slots__ = (
+        'uuid', 'peer_map', 'schedule_id', 'connect_id', 'connect_event',
+        '_host', '_port', '_address', 'db_id', '_conn_state', 'via',
+        '_next_heart_beat_time', 'last_heart_beat_time', 'last_rx_time',
+        'slow_heart_beat_down', 'next_ask_around_time',
+        'last_ask_around_time',
+        # Set by the sender once the socket has been told about this peer.
+        '_first_connect',
+    )
+
     def __init__(self, uuid=None, host=None, port=None, db_id=None):
         """
         Constructor.
@@ -92,15 +136,21 @@ class Peer(object):
         """
         super(Peer, self).__init__()
         self.uuid = uuid
-        self.host = host
-        self.port = port
+        self.peer_map = None
+        self.schedule_id = None
+        self.connect_id = None
+        self.connect_event = None
+        self._host = host
+        self._port = port
+        self._update_address()
         self.db_id = db_id
-        self.conn_state = INITIAL
+        self._conn_state = INITIAL
         self.via = None
 
         # Indicates the responsiveness of the peer.
-        self.next_heart_beat_time = None
+        self._next_heart_beat_time = None
         self.last_heart_beat_time = None
+        self.last_rx_time = None
         self.slow_heart_beat_down = 0
 
         # Don't ask too often about missing peers.
@@ -123,9 +173,68 @@ class Peer(object):
 
     @property
     def address(self):
-        return self.host if self.port is None else 'tcp://%s:%d' % (
-            self.host, self.port)
+        """ The address used to connect to this peer. """
+        return self._address
+
+    def _update_address(self):
+        """ Computes the address when the host or the port change.
+
+        Only the thread that changes the host or the port writes the
+        address, so readers in other threads (the sender) cannot store
+        an address computed from values that have since changed.
+        """
+        self._address = self._host if self._port is None else \
+            'tcp://%s:%d' % (self._host, self._port)
+
+    @property
+    def host(self):
+        """ The host where this peer resides. """
+        return self._host
+
+    @host.setter
+    def host(self, value):
+        previous = self._host
+        self._host = value
+        self._update_address()
+        if self.peer_map is not None and \
+                (previous is None) != (value is None):
+            self.peer_map.peer_host_changed(self)
+
+    @property
+    def port(self):
+        """ The port of this peer on the host. """
+        return self._port
+
+    @port.setter
+    def port(self, value):
+        self._port = value
+        self._update_address()
+
+    @property
+    def next_heart_beat_time(self):
+        """ The time when next heart beat has been scheduled. """
+        return self._next_heart_beat_time
+
+    @next_heart_beat_time.setter
+    def next_heart_beat_time(self, value):
+        self._next_heart_beat_time = value
+        if self.peer_map is not None:
+            self.peer_map.reschedule(self)
 
+    @property
+    def conn_state(self):
+        """ The state of the connection with this peer. """
+        return self._conn_state
+
+    @conn_state.setter
+    def conn_state(self, value):
+        previous = self._conn_state
+        self._conn_state = value
+        if self.peer_map is not None and previous != value:
+            self.peer_map.peer_state_changed(self, previous)
+
+    # Boolean views of conn_state kept for user code; the library itself
+    # compares conn_state with the constants directly.
     @property
     def state_initial(self):
         """ The peer was created but no connection attempt has ben made. """
@@ -196,45 +305,70 @@ class Peer(object):
 
     @property
     def state(self):
-        return Peer.state_to_string(self.conn_state)
+        return Peer.state_to_string(self._conn_state)
 
     @staticmethod
     def state_to_string(state):
-        if state == INITIAL:
-            return 'INITIAL'
-        elif state == CONNECTED:
-            return 'CONNECTED'
-        elif state == ROUTED:
-            return 'ROUTED'
-        elif state == UNREACHABLE:
-            return 'UNREACHABLE'
-        elif state == NO_CONNECTION:
-            return 'NO CONNECTION'
-        else:
-            raise ValueError
+        try:
+            return STATE_NAMES[state]
+        except KeyError:
+            raise ValueError(state)
 
     @property
     def needs_reconnect(self):
         """ Tell if this peer should be reconnected."""
-        return self.conn_state in (INITIAL, NO_CONNECTION, UNREACHABLE)
+        return self._conn_state in RECONNECT_STATES
 
     @property
     def does_heart_beat(self):
         """ Tell if this peer is a valid destination for a
         heart-beat based on its state."""
-        return self.conn_state in (CONNECTED, ROUTED, UNREACHABLE)
+        return self._conn_state in HEART_BEAT_STATES
+
+    def time_since_heart_beat(self, tick):
+        """ The number of seconds since we have last heard from this
+        peer, at the time `tick`. """
+        return tick - self.last_heart_beat_time
 
     def reset_heart_beat(self, app):
         self.next_heart_beat_time = app.tick + HEART_BEAT_INTERVAL
         self.slow_heart_beat_down = 0
         self.last_heart_beat_time = app.tick
 
-    def schedule_heart_beat(self, app):
-        self.next_heart_beat_time = \
-            app.tick + HEART_BEAT_INTERVAL + self.slow_heart_beat_down
+    def schedule_heart_beat(self, app, tick=None):
+        """ Schedules next heart beat relative to `tick`
+        (`app.tick` if not provided) and slows down the next one. """
+        if tick is None:
+            tick = app.tick
+        slow_down = self.slow_heart_beat_down
+        self.next_heart_beat_time = tick + HEART_BEAT_INTERVAL + slow_down
+        slow_down += HEART_BEAT_SLOW_DOWN
         self.slow_heart_beat_down = \
-            min(self.slow_heart_beat_down + HEART_BEAT_SLOW_DOWN,
-                HEART_BEAT_MAX_INTERVAL)
+            slow_down if slow_down < HEART_BEAT_MAX_INTERVAL \
+            else HEART_BEAT_MAX_INTERVAL
+
+    def start_connect_attempt(self, message_id):
+        """
+        Marks the peer as CONNECTING with a hello message in flight.
+
+        The caller is expected to hold the peers lock.
+
+        Arguments:
+            message_id:
+                The id of the hello message that was composed.
+        """
+        self.connect_id = message_id
+        self.connect_event = threading.Event()
+        self.conn_state = CONNECTING
+
+    def end_connect_attempt(self):
+        """
+        Forgets the connect attempt in flight, if any, and wakes up
+        anyone waiting for it to end.
+        """
+        self.connect_id = None
+        if self.connect_event is not None:
+            self.connect_event.set()
 
     def become_connected(self, message, app):
         """
@@ -253,12 +387,13 @@ class Peer(object):
                 Manager instance.
         """
         assert message.source == self.uuid
+        self.end_connect_attempt()
         if message.source == message.previous_hop:
-            self.state_connected = True
+            self.conn_state = CONNECTED
             self.via = None
             logger.debug("%s is now a direct connection", self)
         else:
-            self.state_routed = True
+            self.conn_state = ROUTED
             self.via = message.previous_hop
             logger.debug("%s is now a proxied connection", self)
         self.reset_heart_beat(app)
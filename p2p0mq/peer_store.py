@@ -19,16 +19,28 @@ Code can add and remove peers using the dedicated methods:
 subclassing this class note that these methods are NOT called when the
 database discovers new peers in the database.
 
+The peers are kept in a :class:`PeerMap`, a dictionary that also keeps
+track of the peers that are in each connection state and of the peers
+that have a host, so that the concerns can find the peers they are
+interested in without inspecting each peer.
+
 Convenience properties to generate list of peers based on their status are
 provided: :py:attr:`~PeerStore.peers_in_initial_state`,
+:py:attr:`~PeerStore.peers_connecting`,
 :py:attr:`~PeerStore.peers_connected`, :py:attr:`~PeerStore.peers_routed`,
-:py:attr:`~PeerStore.peers_unreachable`
+:py:attr:`~PeerStore.peers_unreachable`,
+:py:attr:`~PeerStore.peers_no_connection`. They are built from the state
+index of the :class:`PeerMap`, so their cost depends on the number of peers
+they return, not on the total number of peers.
 
 Database
 --------
 
 The initialization of the store is done using the :meth:`~PeerStore.start_db`,
 where the database is read (or created) and synced for the first time.
+A single connection is kept open until :meth:`~PeerStore.terminate_db`;
+file databases are switched to write-ahead logging with relaxed
+synchronization so that periodic syncs do not pay for an fsync each time.
 
 Metadata table is only read once, at :meth:`~PeerStore.start_db` time.
 If the metadata table(*p2p0mq_meta*) does not exist, the database is assumed
@@ -64,14 +76,20 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import contextlib
+import heapq
+import itertools
 import logging
 import sqlite3
 import threading
 import uuid
 from time import time
 
-from p2p0mq.constants import TRACE, SYNC_DB_INTERVAL
-from p2p0mq.peer import Peer
+from p2p0mq.constants import (
+    TRACE, SYNC_DB_INTERVAL, DB_SYNC_LEVEL, DB_BUSY_TIMEOUT
+)
+from p2p0mq.peer import (
+    Peer, INITIAL, CONNECTING, CONNECTED, ROUTED, UNREACHABLE, NO_CONNECTION
+)
 
 
 logger = logging.getLogger('p2p0mq.app')
@@ -79,6 +97,380 @@ logger = logging.getLogger('p2p0mq.app')
 SQLITE_PEERS_TABLE = 'p2p0mq_peers'
 SQLITE_META_TABLE = 'p2p0mq_meta'
 
+# The values accepted by `PRAGMA synchronous`.
+DB_SYNC_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# The statements we run against the database, built once.
+SQL_TABLE_EXISTS = \
+    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1;"
+SQL_SELECT_PEERS = \
+    "SELECT peer_id, uuid, host, port FROM %s;" % SQLITE_PEERS_TABLE
+SQL_SELECT_PEERS_AFTER = \
+    "SELECT peer_id, uuid FROM %s WHERE peer_id > ?;" % SQLITE_PEERS_TABLE
+SQL_INSERT_PEER = \
+    "INSERT INTO %s(uuid,host,port) VALUES(?, ?, ?);" % SQLITE_PEERS_TABLE
+SQL_SELECT_META = "SELECT id, key, value FROM %s;" % SQLITE_META_TABLE
+SQL_INSERT_META = \
+    "INSERT INTO %s(key,value,description) VALUES(?, ?, ?);" % \
+    SQLITE_META_TABLE
+
+
+class PeerSchedule(object):
+    """
+    The peers in some states, ordered by their heart-beat time.
+
+    The schedule is a heap of `(next_heart_beat_time, schedule_id, uuid)`
+    entries. Entries are not removed when a peer changes; instead the
+    :class:`PeerMap` assigns a new `schedule_id` to the peer and pushes
+    a new entry, so entries that no longer match the peer are
+    discarded when they reach the top of the heap.
+
+    Attributes:
+        states (frozenset):
+            The connection states of the peers in this schedule.
+        heap (list):
+            The entries, managed by the :mod:`heapq` module.
+    """
+    def __init__(self, states):
+        """
+        Constructor.
+
+        Arguments:
+            states:
+                The connection states of the peers in this schedule.
+        """
+        super(PeerSchedule, self).__init__()
+        self.states = frozenset(states)
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def is_due(self, tick, inclusive=True):
+        """
+        Tells if the earliest entry in the schedule has come.
+
+        Only the top of the heap is inspected, so this is cheap enough
+        to be called on every loop; it can also be called without
+        holding the peers lock, in which case the answer is a hint:
+        a stale entry may say that a peer is due when it is not and
+        :meth:`~pop_due` will sort that out.
+
+        Arguments:
+            tick (float):
+                Current time.
+            inclusive (bool):
+                Whether an entry scheduled exactly at `tick` is due.
+        """
+        try:
+            deadline = self.heap[0][0]
+        except IndexError:
+            return False
+        return deadline < tick or (inclusive and deadline == tick)
+
+    def push(self, peer):
+        """ Adds an entry for the peer if it belongs in this schedule. """
+        deadline = peer.next_heart_beat_time
+        if deadline is not None and peer.conn_state in self.states:
+            heapq.heappush(self.heap, (deadline, peer.schedule_id, peer.uuid))
+
+    def push_many(self, peers):
+        """
+        Adds entries for the peers that belong in this schedule.
+
+        When the new entries are many compared to the size of the heap
+        they are appended and the heap is rebuilt in a single pass
+        instead of being pushed one by one.
+        """
+        states = self.states
+        entries = [
+            (peer.next_heart_beat_time, peer.schedule_id, peer.uuid)
+            for peer in peers
+            if peer.next_heart_beat_time is not None and
+            peer.conn_state in states]
+        heap = self.heap
+        if len(entries) * max(len(heap), 1).bit_length() > len(heap):
+            heap.extend(entries)
+            heapq.heapify(heap)
+        else:
+            for entry in entries:
+                heapq.heappush(heap, entry)
+
+    def pop_due(self, peers, tick, inclusive=True, limit=None):
+        """
+        Removes the peers whose heart-beat time has come from the schedule.
+
+        The caller is expected to hold the peers lock. The peers that
+        are returned get back into the schedule when their heart-beat time
+        or their state is changed.
+
+        Arguments:
+            peers (PeerMap):
+                The map this schedule belongs to.
+            tick (float):
+                Current time.
+            inclusive (bool):
+                Whether peers scheduled exactly at `tick` are due.
+            limit (int):
+                The maximum number of peers to return; the rest are
+                left in the schedule for the next call.
+        Returns:
+            The list of peers that are due.
+        """
+        heap = self.heap
+        result = []
+        while heap:
+            if limit is not None and len(result) >= limit:
+                break
+            deadline, schedule_id, uuid = heap[0]
+            if deadline > tick or (deadline == tick and not inclusive):
+                break
+            heapq.heappop(heap)
+            peer = peers.get(uuid)
+            if peer is None or peer.schedule_id != schedule_id or \
+                    peer.conn_state not in self.states:
+                continue
+            result.append(peer)
+        return result
+
+
+class PeerMap(dict):
+    """
+    A dictionary of peers that also indexes the peers by their state.
+
+    Keys are the unique identifiers of the peers and values are
+    :class:`p2p0mq.peer.Peer` instances. Peers that are stored in the map
+    inform the map when their connection state, their host or their
+    heart-beat time changes (see :py:attr:`p2p0mq.peer.Peer.conn_state`).
+
+    Code that needs to act on peers when their heart-beat time comes
+    can ask for a :class:`PeerSchedule` (see :meth:`~add_schedule`)
+    instead of inspecting all peers.
+
+    The map has no lock of its own; same rules as for the dictionary
+    apply (see :py:attr:`PeerStore.peers_lock`).
+
+    Attributes:
+        by_state (dict):
+            For each tracked state, the set of the unique identifiers of
+            the peers that are in that state.
+        with_host (set):
+            The unique identifiers of the peers that have a host set.
+        to_connect (set):
+            The unique identifiers of the peers in INITIAL state that
+            have a host set (the ones a connection can be attempted to).
+        schedules (list):
+            The :class:`PeerSchedule` instances kept up to date by this map.
+        _deferred (dict):
+            While inside :meth:`~deferred_reschedule`, the peers
+            that need to be rescheduled on exit.
+    """
+    tracked_states = (
+        INITIAL, CONNECTING, CONNECTED, ROUTED, UNREACHABLE, NO_CONNECTION)
+
+    def __init__(self, *args, **kwargs):
+        """ Constructor. """
+        super(PeerMap, self).__init__()
+        self.by_state = {state: set() for state in self.tracked_states}
+        self.with_host = set()
+        self.to_connect = set()
+        self.schedules = []
+        self._schedule_ids = itertools.count()
+        self._deferred = None
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, peer):
+        previous = self.get(key)
+        if previous is not None and previous is not peer:
+            self._forget(key, previous)
+        super(PeerMap, self).__setitem__(key, peer)
+        self._remember(key, peer)
+
+    def __delitem__(self, key):
+        peer = self[key]
+        super(PeerMap, self).__delitem__(key)
+        self._forget(key, peer)
+
+    def pop(self, key, *args):
+        if key not in self:
+            return super(PeerMap, self).pop(key, *args)
+        peer = super(PeerMap, self).pop(key)
+        self._forget(key, peer)
+        return peer
+
+    def popitem(self):
+        key, peer = super(PeerMap, self).popitem()
+        self._forget(key, peer)
+        return key, peer
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, peer in dict(*args, **kwargs).items():
+            self[key] = peer
+
+    def clear(self):
+        for key, peer in list(self.items()):
+            self._forget(key, peer)
+        super(PeerMap, self).clear()
+
+    def _remember(self, key, peer):
+        """ Adds the peer to the indexes. """
+        peer.peer_map = self
+        index = self.by_state.get(peer.conn_state)
+        if index is not None:
+            index.add(key)
+        if peer.host is not None:
+            self.with_host.add(key)
+            if peer.conn_state == INITIAL:
+                self.to_connect.add(key)
+        self.reschedule(peer)
+
+    def _forget(self, key, peer):
+        """ Removes the peer from the indexes. """
+        if peer.peer_map is self:
+            peer.peer_map = None
+        for index in self.by_state.values():
+            index.discard(key)
+        self.with_host.discard(key)
+        self.to_connect.discard(key)
+        if self._deferred is not None:
+            self._deferred.pop(key, None)
+
+    def peer_state_changed(self, peer, previous):
+        """
+        Called by a peer when its connection state changes.
+
+        Arguments:
+            peer (Peer):
+                The peer that changed the state.
+            previous (int):
+                The state before the change.
+        """
+        index = self.by_state.get(previous)
+        if index is not None:
+            index.discard(peer.uuid)
+        index = self.by_state.get(peer.conn_state)
+        if index is not None:
+            index.add(peer.uuid)
+        self._update_to_connect(peer)
+        self.reschedule(peer)
+
+    def peer_host_changed(self, peer):
+        """
+        Called by a peer when its host is set or cleared.
+
+        Arguments:
+            peer (Peer):
+                The peer that changed the host.
+        """
+        if peer.host is None:
+            self.with_host.discard(peer.uuid)
+        else:
+            self.with_host.add(peer.uuid)
+        self._update_to_connect(peer)
+        self.reschedule(peer)
+
+    def _update_to_connect(self, peer):
+        """ Adds or removes the peer from :py:attr:`to_connect`. """
+        if peer.conn_state == INITIAL and peer.host is not None:
+            self.to_connect.add(peer.uuid)
+        else:
+            self.to_connect.discard(peer.uuid)
+
+    def snapshot(self, states=None):
+        """
+        Returns the peers as a tuple that can be inspected without the lock.
+
+        The caller is expected to hold the peers lock while this method
+        runs; the peers in the result can be changed by other threads
+        once the lock is released, so code that acts on them needs to
+        take the lock again and check them.
+
+        Arguments:
+            states:
+                If provided, only the peers in these connection states are
+                returned; these are found through :py:attr:`by_state`.
+        """
+        if states is None:
+            return tuple(self.values())
+        return tuple(self[uuid]
+                     for state in states
+                     for uuid in self.by_state[state])
+
+    def add_schedule(self, states):
+        """
+        Creates a schedule for the peers in some states.
+
+        The caller is expected to hold the peers lock.
+
+        Arguments:
+            states:
+                The connection states of the peers in the schedule.
+        Returns:
+            The new :class:`PeerSchedule`, which includes present peers.
+        """
+        schedule = PeerSchedule(states)
+        self.schedules.append(schedule)
+        for peer in self.values():
+            schedule.push(peer)
+        return schedule
+
+    def remove_schedule(self, schedule):
+        """ Stops updating a schedule created by :meth:`~add_schedule`. """
+        if schedule in self.schedules:
+            self.schedules.remove(schedule)
+
+    def reschedule(self, peer):
+        """
+        Updates the schedules after a change in the peer.
+
+        This is called by the peers when their heart-beat time
+        changes, and by the map itself for other changes.
+
+        Arguments:
+            peer (Peer):
+                The peer that changed.
+        """
+        deferred = self._deferred
+        if deferred is not None:
+            deferred[peer.uuid] = peer
+            return
+        peer.schedule_id = next(self._schedule_ids)
+        for schedule in self.schedules:
+            schedule.push(peer)
+
+    @contextlib.contextmanager
+    def deferred_reschedule(self):
+        """
+        Groups the changes to the schedules made inside the block.
+
+        Peers that change while inside the block are rescheduled
+        once, when the block ends, and the schedules receive them
+        all at once (see :meth:`PeerSchedule.push_many`). This is meant
+        for code that changes many peers in one go, like the heart-beat
+        concern.
+
+        The caller is expected to hold the peers lock for the whole
+        block.
+        """
+        if self._deferred is not None:
+            yield
+            return
+        deferred = self._deferred = {}
+        try:
+            yield
+        finally:
+            self._deferred = None
+            peers = list(deferred.values())
+            for peer in peers:
+                peer.schedule_id = next(self._schedule_ids)
+            for schedule in self.schedules:
+                schedule.push_many(peers)
+
 
 class PeerStore(object):
     """
@@ -88,11 +480,25 @@ class PeerStore(object):
         db_file_path (str):
             The path of the local sqlite database used for peer
             persistence, among others.
-        peers (dict):
+        db_sync_level (str):
+            The value of `PRAGMA synchronous` for the database connection
+            (`OFF`, `NORMAL`, `FULL` or `EXTRA`).
+        peers (PeerMap):
             The peers we know of, with keys being the unique identifier
             of the peer and values being :class:`p2p0mq.peer.Peer` instances.
         peers_lock (threading.Lock):
             Use the peers attribute only after you have acquired this lock.
+        peer_added (threading.Event):
+            Set each time a peer is added through
+            :meth:`~p2p0mq.peer_store.PeerStore.add_peer` or
+            :meth:`~p2p0mq.peer_store.PeerStore.add_peer_locked`;
+            code that waits for a new peer should clear it first.
+        _db_conn (sqlite3.Connection):
+            The connection to the database, opened on first use and
+            closed by :meth:`~p2p0mq.peer_store.PeerStore.terminate_db`.
+        _db_lock (threading.Lock):
+            Serializes the use of the database connection; it is never
+            acquired while holding the peers lock.
         next_peer_db_sync_time (float):
             time (in seconds since the Epoch) when next database sync should
             take place.
@@ -104,7 +510,8 @@ class PeerStore(object):
             The time (in seconds since the Epoch) when the database
             has been created.
     """
-    def __init__(self, db_file_path=None, app_uuid=None, *args, **kwargs):
+    def __init__(self, db_file_path=None, app_uuid=None,
+                 db_sync_level=DB_SYNC_LEVEL, *args, **kwargs):
         """
         Constructor.
 
@@ -115,12 +522,21 @@ class PeerStore(object):
         app_uuid:
             Unique identifier of the local peer. If not set a unique id will
             be generated at a later time.
+        db_sync_level (str):
+            The value of `PRAGMA synchronous` for the database connection.
+            Tests that use a throw-away database can pass `OFF`.
 
         """
         super(PeerStore, self).__init__(*args, **kwargs)
+        if db_sync_level.upper() not in DB_SYNC_LEVELS:
+            raise ValueError("Unknown database sync level %r" % db_sync_level)
         self.db_file_path = db_file_path
-        self.peers = {}
+        self.db_sync_level = db_sync_level.upper()
+        self.peers = PeerMap()
         self.peers_lock = threading.Lock()
+        self.peer_added = threading.Event()
+        self._db_conn = None
+        self._db_lock = threading.Lock()
 
         self.next_peer_db_sync_time = time() - SYNC_DB_INTERVAL
 
@@ -154,7 +570,13 @@ class PeerStore(object):
     def add_peer(self, peer):
         """ Adds a peer from code (database does not call this method). """
         with self.peers_lock:
-            self.peers[peer.uuid] = peer
+            self.add_peer_locked(peer)
+
+    def add_peer_locked(self, peer):
+        """ Adds a peer from code when the caller already holds
+        the :py:attr:`peers_lock` (database does not call this method). """
+        self.peers[peer.uuid] = peer
+        self.peer_added.set()
 
     def take_peer(self, peer):
         """ Removes a peer (database does not call this method). """
@@ -162,29 +584,51 @@ class PeerStore(object):
             return self.peers.pop(
                 peer.uuid if isinstance(peer, Peer) else peer)
 
+    def note_traffic(self, messages, tick):
+        """
+        Records the time when the peers that handed us these
+        messages were last heard from.
+
+        Only the previous hop is known to be alive when a message
+        arrives, so that is the peer that gets updated.
+        """
+        hops = {message.previous_hop for message in messages}
+        with self.peers_lock:
+            peers = self.peers
+            for hop in hops:
+                peer = peers.get(hop)
+                if peer is not None:
+                    peer.last_rx_time = tick
+
     @property
     def peers_in_initial_state(self):
         with self.peers_lock:
-            return [peer for peer in self.peers.values()
-                    if peer.state_initial]
+            return list(self.peers.snapshot((INITIAL,)))
+
+    @property
+    def peers_connecting(self):
+        with self.peers_lock:
+            return list(self.peers.snapshot((CONNECTING,)))
 
     @property
     def peers_connected(self):
         with self.peers_lock:
-            return [peer for peer in self.peers.values()
-                    if peer.state_connected]
+            return list(self.peers.snapshot((CONNECTED,)))
 
     @property
     def peers_routed(self):
         with self.peers_lock:
-            return [peer for peer in self.peers.values()
-                    if peer.state_routed]
+            return list(self.peers.snapshot((ROUTED,)))
 
     @property
     def peers_unreachable(self):
         with self.peers_lock:
-            return [peer for peer in self.peers.values()
-                    if peer.state_unreachable]
+            return list(self.peers.snapshot((UNREACHABLE,)))
+
+    @property
+    def peers_no_connection(self):
+        with self.peers_lock:
+            return list(self.peers.snapshot((NO_CONNECTION,)))
 
     def start_db(self):
         """ Called when an app is done with this instance. """
@@ -201,15 +645,35 @@ class PeerStore(object):
         :meth:`p2p0mq.app.theapp.LocalPeer.create` does not prevent
         this method from being executed).
         """
-        pass
+        db_lock = getattr(self, '_db_lock', None)
+        if db_lock is None:
+            return
+        with db_lock:
+            if self._db_conn is not None:
+                self._db_conn.close()
+                self._db_conn = None
+
+    def db_connection(self):
+        """
+        Returns the connection to the database, opening it if needed.
+
+        The caller should hold the :py:attr:`_db_lock`.
+        """
+        if self._db_conn is None:
+            conn = sqlite3.connect(
+                self.db_file_path,
+                uri=self.db_file_path.startswith("file:"),
+                timeout=DB_BUSY_TIMEOUT,
+                check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=%s;" % self.db_sync_level)
+            conn.execute("PRAGMA temp_store=MEMORY;")
+            self._db_conn = conn
+        return self._db_conn
 
     def table_exists(self, c, name):
         """ Tells if our table exists in the database. """
-        c.execute(
-            "SELECT name FROM sqlite_master "
-            "    WHERE type='table' "
-            "    AND name=?;",
-            (name, ))
+        c.execute(SQL_TABLE_EXISTS, (name, ))
         result = c.fetchone()
         if result is None:
             return False
@@ -226,19 +690,22 @@ class PeerStore(object):
             ")" % SQLITE_PEERS_TABLE)
 
     def create_meta_table(self, c):
-        """ Creates the table into the database. """
+        """ Creates the table into the database.
+
+        The values are stored with their own type (the column has no
+        affinity), so they are read back as they were written.
+        """
         c.execute(
             "CREATE TABLE %s ("
             "    id INTEGER PRIMARY KEY,"
             "    key TEXT UNIQUE,"
-            "    value TEXT,"
+            "    value BLOB,"
             "    description TEXT"
             ")" % SQLITE_META_TABLE)
         self.uuid = uuid.uuid4().hex if self.uuid is None else self.uuid
         self.db_created = time()
         c.executemany(
-            "INSERT INTO %s(key,value,description) "
-            "    VALUES(?, ?, ?);" % SQLITE_META_TABLE,
+            SQL_INSERT_META,
             (
                 ('uuid', self.uuid,
                  'the unique identification of this instance'),
@@ -248,19 +715,21 @@ class PeerStore(object):
 
     def read_metadata(self):
         logger.log(TRACE, "Reading database %s metadata", self.db_file_path)
-        with contextlib.closing(
-                sqlite3.connect(
-                    self.db_file_path,
-                    uri=self.db_file_path.startswith("file:"))) as conn:
+        with self._db_lock:
+            conn = self.db_connection()
             try:
                 c = conn.cursor()
                 if not self.table_exists(c, SQLITE_META_TABLE):
+                    # A new database; the peers table is created in the
+                    # same transaction, so the first sync saves peers
+                    # right away.
                     self.create_meta_table(c)
+                    if not self.table_exists(c, SQLITE_PEERS_TABLE):
+                        self.create_peers_table(c)
                     conn.commit()
                     return
 
-                c.execute(
-                    "SELECT id, key, value FROM %s;" % SQLITE_META_TABLE)
+                c.execute(SQL_SELECT_META)
                 for row in c.fetchall():
                     setattr(self, row[1], row[2])
             except conn.Error:
@@ -271,13 +740,12 @@ class PeerStore(object):
         if (self.next_peer_db_sync_time > time()) and not force:
             return None
 
-        logger.log(TRACE, "Synchronizing the list of peers with the "
-                          "content of the database")
-        with contextlib.closing(
-                sqlite3.connect(
-                    self.db_file_path,
-                    uri=self.db_file_path.startswith("file:"))) as conn:
-
+        trace = logger.isEnabledFor(TRACE)
+        if trace:
+            logger.log(TRACE, "Synchronizing the list of peers with the "
+                              "content of the database")
+        with self._db_lock:
+            conn = self.db_connection()
             c = conn.cursor()
             if not self.table_exists(c, SQLITE_PEERS_TABLE):
                 self.create_peers_table(c)
@@ -286,12 +754,13 @@ class PeerStore(object):
             # Collect peers that are in database but not in memory.
             database_peers = {}
             new_peers = {}
-            c.execute(
-                "SELECT peer_id, uuid, host, port FROM %s;" %
-                SQLITE_PEERS_TABLE)
+            c.execute(SQL_SELECT_PEERS)
+
+            rows = c.fetchall()
 
+            # The lock is not held while talking to the database.
             with self.peers_lock:
-                for row in c.fetchall():
+                for row in rows:
                     peer = Peer(
                         uuid=row[1], db_id=row[0],
                         host=row[2], port=row[3])
@@ -299,30 +768,52 @@ class PeerStore(object):
                         database_peers[peer.uuid] = peer
                     else:
                         new_peers[peer.uuid] = peer
+                memory_peers = [peer for peer in self.peers.snapshot()
+                                if peer.uuid not in database_peers]
+
+            # Save peers that are only present in the memory.
+            saved_peer_count = len(memory_peers)
+            inserted = {}
+            if saved_peer_count:
+                assert all(peer.db_id is None for peer in memory_peers)
+                last_id = max((row[0] for row in rows), default=0)
+                c.executemany(
+                    SQL_INSERT_PEER,
+                    [(peer.uuid, peer.host, peer.port)
+                     for peer in memory_peers]
+                )
+
+                # The ids of the new rows are larger than any id we've seen;
+                # if others were also inserted, ours are the latest ones.
+                c.execute(SQL_SELECT_PEERS_AFTER, (last_id,))
+                for peer_id, peer_uuid in c.fetchall():
+                    if peer_id > inserted.get(peer_uuid, last_id):
+                        inserted[peer_uuid] = peer_id
+
+                # All the rows go in a single transaction; it is closed
+                # before the memory learns the new ids.
+                conn.commit()
 
-                # Save peers that are only present in the memory.
-                saved_peer_count = 0
-                for peer in self.peers.values():
-                    if peer.uuid not in database_peers:
-                        assert peer.db_id is None
-                        c.execute(
-                            "INSERT INTO %s(uuid,host,port) "
-                            "    VALUES(?, ?, ?);" % SQLITE_PEERS_TABLE,
-                            (peer.uuid, peer.host, peer.port)
-                        )
-                        peer.db_id = c.lastrowid
-                        saved_peer_count = saved_peer_count + 1
-
-                # Integrate new peers.
-                self.peers.update(new_peers)
-
-            conn.commit()
-
-        logger.log(TRACE, "Database has been synchronized. "
-                          "%d loaded peers, %d saved peers, "
-                          "%d total peers",
-                   len(new_peers), saved_peer_count, len(self.peers)
-                   )
+            with self.peers_lock:
+                for peer in memory_peers:
+                    peer.db_id = inserted.get(peer.uuid)
+
+                # Integrate new peers; a peer with same uuid may have
+                # been added in the meantime, in which case that one is
+                # kept and it only learns its database id.
+                for peer_uuid, peer in new_peers.items():
+                    existing = self.peers.get(peer_uuid)
+                    if existing is None:
+                        self.peers[peer_uuid] = peer
+                    elif existing.db_id is None:
+                        existing.db_id = peer.db_id
+
+        if trace:
+            logger.log(TRACE, "Database has been synchronized. "
+                              "%d loaded peers, %d saved peers, "
+                              "%d total peers",
+                       len(new_peers), saved_peer_count, len(self.peers)
+                       )
         self.next_peer_db_sync_time = time() + SYNC_DB_INTERVAL
         return new_peers
 
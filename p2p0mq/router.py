@@ -6,9 +6,10 @@ from __future__ import print_function
 
 import logging
 
+from p2p0mq.concerns.ask_around import AskAroundConcern
 from p2p0mq.constants import PROCESS_LIMIT_PER_LOOP, ASK_AROUND_INTERVAL, TRACE
 from p2p0mq.message import Message
-from p2p0mq.peer import Peer
+from p2p0mq.peer import Peer, CONNECTED
 
 logger = logging.getLogger('p2p0mq')
 
@@ -37,26 +38,34 @@ class Router(object):
         """
         logger.log(TRACE, "Processing routes...")
         messages = []
-        for i in range(min(PROCESS_LIMIT_PER_LOOP, len(queue))):
-            # Get a message.
-            message = queue.dequeue()
-            logger.log(TRACE, "Routing message %r", message)
-            if len(message) == 0:
-                break
-            assert len(message) == 1
-            message = message[0]
-
+        routed = queue.dequeue_many(min(PROCESS_LIMIT_PER_LOOP, len(queue)))
+        for message in routed:
             # The message should not be directed at this instance.
             assert message.to != self.uuid
             assert message.to is not None
 
-            if message.to in self.peers:
+        # Look up (or create) all the destinations under a single
+        # acquisition of the lock.
+        with self.peers_lock:
+            peers = self.peers
+            destinations = []
+            for message in routed:
+                peer = peers.get(message.to)
+                known = peer is not None
+                if not known:
+                    peer = Peer(uuid=message.to)
+                    peers[message.to] = peer
+                destinations.append((message, peer, known))
+
+        # The concern is looked up once, when first needed.
+        ask_around = None
+        dropped = []
+        for message, peer, known in destinations:
+            logger.log(TRACE, "Routing message %r", message)
+            if known:
                 logger.log(TRACE, "Destination known")
 
-                # We have heard of this peer before.
-                peer = self.peers[message.to]
-
-                if peer.state_connected:
+                if peer.conn_state == CONNECTED:
                     logger.log(TRACE, "Destination known and connected")
                     # Attempt to send the message directly to the peer.
                     messages.append(message)
@@ -73,10 +82,7 @@ class Router(object):
                     continue
                 logger.log(TRACE, "Peer doesn't have a proxy set")
             else:
-                logger.log(TRACE, "Unknown peer; creating it")
-                peer = Peer(uuid=message.to)
-                with self.peers_lock:
-                    self.peers[message.to] = peer
+                logger.log(TRACE, "Unknown peer; created it")
 
             if self.default_route is not None:
                 # If we have a default route all messages not explicitly
@@ -96,16 +102,30 @@ class Router(object):
                 messages.extend(self.ask_around_for_peer(message.to))
                 continue
 
-            messages.extend(
-                self.concerns["ask around"].compose_ask_around_message(
-                    peer, [message.previous_hop, message.source]))
+            if ask_around is None:
+                ask_around = self.concerns[AskAroundConcern.command_id]
+            messages.extend(ask_around.compose_ask_around_message(
+                peer, [message.previous_hop, message.source]))
 
             # The last resort is to drop the message.
-            logger.log(TRACE, "Dropping routed message")
-            self.drop_routed_message(message)
+            dropped.append(message)
+
+        if dropped:
+            logger.log(TRACE, "Dropping %d routed message(s)", len(dropped))
+            self.drop_routed_messages(dropped)
 
         logger.log(TRACE, "Done processing routes.")
         return messages
 
+    def drop_routed_messages(self, messages):
+        """
+        Called with the messages of a batch that could not be routed.
+
+        The default implementation hands each of them to
+        :meth:`~drop_routed_message`.
+        """
+        for message in messages:
+            self.drop_routed_message(message)
+
     def drop_routed_message(self, message):
         pass
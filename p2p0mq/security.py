@@ -37,10 +37,14 @@ read or create certificates for current peer;
 * :meth:`~SecurityManager.cert_file_by_uuid` will compute the path towards \
 the certificate corresponding to that uuid; it is used in
 * :meth:`~SecurityManager.cert_key_by_uuid` which parses the content of the \
-file and reads the key;
+file and reads the key; the keys are cached and a file is only parsed again \
+when its modification time changes;
+* :meth:`~SecurityManager.load_all_public_keys` reads all public \
+certificates in one go, each time the authenticator is (re)configured;
 * :meth:`~SecurityManager.exchange_certificates` is mostly of use for testing \
 but offers some hints about what the user should do to securely connect \
-two peers using certificates.
+two peers using certificates; :meth:`~SecurityManager.exchange_many` does \
+the same for several pairs, reconfiguring each authenticator only once.
 
 """
 from __future__ import unicode_literals
@@ -48,16 +52,70 @@ from __future__ import print_function
 
 import logging
 import os
-import re
 import shutil
+import stat
 import tempfile
-from time import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import zmq
 from zmq.auth.thread import ThreadAuthenticator
 
+from p2p0mq.constants import CERT_KEY_CACHE_SIZE, CERT_FILE_CACHE_SIZE
+
 logger = logging.getLogger('p2p0mq.sec')
 
+# Lines starting with these hold the secret key in a certificate file.
+SECRET_KEY_PREFIXES = (b'secret-key', b'private-key')
+
+
+def link_or_copy(src, dst):
+    """
+    Makes the file at `src` available at `dst`.
+
+    A hard link is created if possible (no data is copied); if
+    that fails (different file systems, `dst` exists, etc.) the content
+    is copied.
+    """
+    try:
+        os.link(src, dst)
+    except (OSError, NotImplementedError):
+        try:
+            shutil.copyfile(src, dst)
+        except shutil.SameFileError:
+            pass
+
+
+def try_stat(path):
+    """
+    Retrieves the status of a file.
+
+    Returns:
+        The `os.stat_result` or `None` if the path does not exist
+        or cannot be accessed.
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def read_certificate(path):
+    """
+    Reads the keys from a certificate file.
+
+    Returns:
+        The `(public_key, secret_key)` tuple or `None` if the file
+        could not be read.
+    """
+    try:
+        return zmq.auth.load_certificate(path)
+    except (OSError, ValueError):
+        logger.error("Unable to read the certificate %s",
+                     path, exc_info=True)
+        return None
+
 
 class SecurityManager(object):
     """
@@ -69,9 +127,9 @@ class SecurityManager(object):
         public_cert_dir (str):
             The path towards the directory that stores public certificates.
         temp_cert_dir (str):
-            The path towards the temporary directory (used for generating
-            new certificates). If not provided, it defaults to system's
-            temporary directory.
+            The path towards the temporary directory of the store (new
+            certificates are generated directly in the private directory).
+            If not provided, it defaults to system's temporary directory.
         no_encryption (bool):
             Enable or disable encryption at peer level. Peers that use
             encryption can only connect to other peers that use encryption
@@ -82,6 +140,17 @@ class SecurityManager(object):
             The path towards the private certificate of this peer.
         auth_thread (ThreadAuthenticator):
             A separate thread used by zmq to authenticate our peers.
+        cert_keys (OrderedDict):
+            The keys read from certificate files, with the path of the
+            file as key and `(modification time, public key, secret key)`
+            as value; least recently used entries come first.
+        cert_keys_lock (threading.Lock):
+            Protects :py:attr:`cert_keys`.
+        cert_files (dict):
+            The paths computed by :meth:`~cert_file_by_uuid`, with
+            `(uuid, public)` as key and `(directory, path)` as value;
+            it is emptied once it holds
+            :py:data:`~p2p0mq.constants.CERT_FILE_CACHE_SIZE` entries.
 
     """
     def __init__(self,
@@ -99,8 +168,8 @@ class SecurityManager(object):
             public_cert_dir (str):
                 The path towards the directory that stores public certificates.
             temp_cert_dir (str):
-                The path towards the temporary directory (used for generating
-                new certificates). Defaults to system's temporary directory.
+                The path towards the temporary directory of the store.
+                Defaults to system's temporary directory.
             no_encryption (bool):
                 Enable or disable encryption at peer level. Peers that use
                 encryption can only connect to other peers that use encryption
@@ -124,6 +193,11 @@ class SecurityManager(object):
         # Authentication thread.
         self.auth_thread = None
 
+        # Keys that were already read from the certificates.
+        self.cert_keys = OrderedDict()
+        self.cert_keys_lock = threading.Lock()
+        self.cert_files = {}
+
     def start_auth(self, context):
         """
         Starts the authentication thread if encryption is enabled.
@@ -143,6 +217,7 @@ class SecurityManager(object):
 
             self.auth_thread.configure_curve(
                 domain='*', location=self.public_cert_dir)
+            self.load_all_public_keys()
 
     def terminate_auth(self):
         """
@@ -167,13 +242,9 @@ class SecurityManager(object):
             uuid:
                 The unique identification of local peer.
         """
-
-        if not os.path.isdir(self.private_cert_dir):
-            os.makedirs(self.private_cert_dir)
-        if not os.path.isdir(self.public_cert_dir):
-            os.makedirs(self.public_cert_dir)
-        if not os.path.isdir(self.temp_cert_dir):
-            os.makedirs(self.temp_cert_dir)
+        os.makedirs(self.private_cert_dir, exist_ok=True)
+        os.makedirs(self.public_cert_dir, exist_ok=True)
+        os.makedirs(self.temp_cert_dir, exist_ok=True)
 
         self.public_file, self.private_file = \
             self.cert_pair_check_gen(uuid)
@@ -189,8 +260,10 @@ class SecurityManager(object):
         """
         cert_pub = self.cert_file_by_uuid(uuid, public=True)
         cert_prv = self.cert_file_by_uuid(uuid, public=False)
-        pub_exists = os.path.isfile(cert_pub)
-        prv_exists = os.path.isfile(cert_prv)
+        st_pub = try_stat(cert_pub)
+        st_prv = try_stat(cert_prv)
+        pub_exists = st_pub is not None and stat.S_ISREG(st_pub.st_mode)
+        prv_exists = st_prv is not None and stat.S_ISREG(st_prv.st_mode)
 
         if pub_exists and prv_exists:
             # Both files exist. Yey.
@@ -205,19 +278,32 @@ class SecurityManager(object):
         elif not pub_exists and prv_exists:
             # The private certificate exists but the public one doesn't.
             # We can extract the key from the private one.
-            with open(cert_prv, 'r') as fin:
-                data = re.sub(r'.*private-key = "(.+)"', "", fin.read(),
-                              re.MULTILINE)
-            with open(cert_pub, 'w') as fout:
-                fout.write(data)
+            with open(cert_prv, 'rb') as fin:
+                data = b''.join(
+                    line for line in fin
+                    if not line.lstrip().startswith(SECRET_KEY_PREFIXES))
+            try:
+                with open(cert_pub, 'xb') as fout:
+                    fout.write(data)
+            except FileExistsError:
+                # Someone else has written it in the meantime.
+                pass
         else:
-            # Neither exists.
+            # Neither exists. The pair is generated in the private
+            # directory under the name of the peer, so the secret file
+            # is already in place and the public one is only renamed.
+            if isinstance(uuid, bytes):
+                uuid = uuid.decode('utf-8')
             public_file, secret_file = \
                 zmq.auth.create_certificates(
-                    self.temp_cert_dir,
-                    '%r' % time())
-            shutil.move(public_file, cert_pub)
-            shutil.move(secret_file, cert_prv)
+                    self.private_cert_dir, '%s' % uuid)
+            if secret_file != cert_prv:
+                os.replace(secret_file, cert_prv)
+            try:
+                os.replace(public_file, cert_pub)
+            except OSError:
+                # Not on the same file system.
+                shutil.move(public_file, cert_pub)
         return cert_pub, cert_prv
 
     def cert_file_by_uuid(self, uuid, public=True):
@@ -225,6 +311,9 @@ class SecurityManager(object):
         Computes the path of a certificate inside the certificate store
         based on the name of the peer.
 
+        The result is remembered in :py:attr:`cert_files` for as long
+        as the directory stays the same.
+
         Arguments:
             uuid:
                 The unique identification of the peer. Usually, this is
@@ -233,18 +322,30 @@ class SecurityManager(object):
                 If True it retrieves the path of the public certificate,
                 if False it retrieves the path of the private certificate.
         """
+        directory = self.public_cert_dir if public else self.private_cert_dir
+        key = (uuid, public)
+        entry = self.cert_files.get(key)
+        if entry is not None and entry[0] == directory:
+            return entry[1]
+
         if isinstance(uuid, bytes):
-            uuid = uuid.decode('utf-8')
+            name = uuid.decode('utf-8')
+        else:
+            name = uuid
         pb_vs_pv = 'key' if public else 'key_secret'
-        return os.path.join(
-            self.public_cert_dir if public else self.private_cert_dir,
-            '%s.%s' % (uuid, pb_vs_pv)
-        )
+        result = os.path.join(directory, '%s.%s' % (name, pb_vs_pv))
+        if len(self.cert_files) >= CERT_FILE_CACHE_SIZE:
+            self.cert_files.clear()
+        self.cert_files[key] = (directory, result)
+        return result
 
     def cert_key_by_uuid(self, uuid, public=True):
         """
         Reads the key from corresponding certificate file.
 
+        The keys are kept in :py:attr:`cert_keys`; the file is parsed again
+        only if its modification time has changed.
+
         Arguments:
             uuid:
                 The unique identification of the peer. Usually, this is
@@ -254,14 +355,101 @@ class SecurityManager(object):
                 if False it retrieves the private key.
         """
         file = self.cert_file_by_uuid(uuid=uuid, public=public)
+        cache = self.cert_keys
+        st = try_stat(file)
+        if st is None:
+            with self.cert_keys_lock:
+                cache.pop(file, None)
+            return None
+        mtime = st.st_mtime_ns
+
+        with self.cert_keys_lock:
+            entry = cache.get(file)
+            if entry is not None and entry[0] == mtime:
+                cache.move_to_end(file)
+                return entry[1] if public else entry[2]
+
         logger.debug("%s certificate for uuid %s is loaded from %s",
                      'Public' if public else 'Private',
                      uuid, file)
-        if not os.path.exists(file):
-            return None
         public_key, secret_key = zmq.auth.load_certificate(file)
+        with self.cert_keys_lock:
+            self._store_cert_keys(file, mtime, public_key, secret_key)
         return public_key if public else secret_key
 
+    def _store_cert_keys(self, file, mtime, public_key, secret_key):
+        """ Adds an entry to :py:attr:`cert_keys`; the caller is expected
+        to hold :py:attr:`cert_keys_lock`. """
+        cache = self.cert_keys
+        cache[file] = (mtime, public_key, secret_key)
+        cache.move_to_end(file)
+        while len(cache) > CERT_KEY_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def load_all_public_keys(self, workers=None):
+        """
+        Reads all the public certificates in :py:attr:`public_cert_dir`.
+
+        The keys are placed in :py:attr:`cert_keys`, so that
+        later calls to :meth:`~cert_key_by_uuid` find them there. Files
+        that were already read and did not change are not parsed again.
+
+        Arguments:
+            workers (int):
+                If more than one, the files that need parsing are
+                distributed to a pool of this many threads, which helps
+                with large stores (reading the files releases the GIL).
+
+        Returns:
+            A dictionary with the uuid of the peers as keys and their
+            public keys as values.
+        """
+        result = {}
+        try:
+            with os.scandir(self.public_cert_dir) as iterator:
+                entries = [entry for entry in iterator
+                           if entry.name.endswith('.key') and
+                           entry.is_file()]
+        except OSError:
+            logger.error("Unable to list the public certificates in %s",
+                         self.public_cert_dir, exc_info=True)
+            return result
+
+        # Use the cached keys where possible.
+        cache = self.cert_keys
+        to_load = []
+        for entry in entries:
+            try:
+                mtime = entry.stat().st_mtime_ns
+            except OSError:
+                continue
+            with self.cert_keys_lock:
+                cached = cache.get(entry.path)
+            if cached is not None and cached[0] == mtime:
+                result[entry.name[:-4]] = cached[1]
+            else:
+                to_load.append((entry, mtime))
+
+        # Parse the rest.
+        paths = [entry.path for entry, mtime in to_load]
+        if workers is not None and workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                loaded = list(executor.map(read_certificate, paths))
+        else:
+            loaded = [read_certificate(path) for path in paths]
+
+        with self.cert_keys_lock:
+            for (entry, mtime), keys in zip(to_load, loaded):
+                if keys is None:
+                    continue
+                public_key, secret_key = keys
+                self._store_cert_keys(
+                    entry.path, mtime, public_key, secret_key)
+                result[entry.name[:-4]] = public_key
+        logger.debug("%d public certificates were loaded from %s",
+                     len(result), self.public_cert_dir)
+        return result
+
     def exchange_certificates(self, other):
         """
         Copies the certificates so that the two instances can
@@ -271,24 +459,47 @@ class SecurityManager(object):
             other (SecurityManager):
                 The security manager of the other peer.
         """
-        if self.no_encryption:
-            logger.error("Encryption was disabled in %s", self)
-            return
-        if other.no_encryption:
-            logger.error("Encryption was disabled in %s", other)
-            return
-
-        shutil.copy(
-            self.public_file,
-            os.path.join(other.public_cert_dir,
-                         os.path.basename(self.public_file))
-        )
-        shutil.copy(
-            other.public_file,
-            os.path.join(self.public_cert_dir,
-                         os.path.basename(other.public_file))
-        )
-        self.auth_thread.configure_curve(
-            domain='*', location=self.public_cert_dir)
-        other.auth_thread.configure_curve(
-            domain='*', location=other.public_cert_dir)
+        SecurityManager.exchange_many(((self, other),))
+
+    @staticmethod
+    def exchange_many(pairs):
+        """
+        Copies the certificates for a number of pairs of instances
+        so that each pair can authenticate to each other.
+
+        All certificates are copied first; then each instance
+        reconfigures its authenticator (a round-trip to the authenticator
+        thread) and reloads its public keys only once.
+
+        Arguments:
+            pairs:
+                An iterable of `(SecurityManager, SecurityManager)` tuples.
+        """
+        changed = []
+        for first, second in pairs:
+            if first.no_encryption:
+                logger.error("Encryption was disabled in %s", first)
+                continue
+            if second.no_encryption:
+                logger.error("Encryption was disabled in %s", second)
+                continue
+
+            link_or_copy(
+                first.public_file,
+                os.path.join(second.public_cert_dir,
+                             os.path.basename(first.public_file))
+            )
+            link_or_copy(
+                second.public_file,
+                os.path.join(first.public_cert_dir,
+                             os.path.basename(second.public_file))
+            )
+            for manager in (first, second):
+                if manager not in changed:
+                    changed.append(manager)
+
+        for manager in changed:
+            if manager.auth_thread is not None:
+                manager.auth_thread.configure_curve(
+                    domain='*', location=manager.public_cert_dir)
+            manager.load_all_public_keys()
@@ -77,15 +77,20 @@ class KoLoopThread(KoThread):
             result = -10
 
         else:
+            # The methods used on each loop are looked up only once.
+            sleep_wait = self.sleep.wait
+            sleep_clear = self.sleep.clear
+            stop_is_set = self.stop.is_set
+            execute = self.execute
             while True:
                 self.run_loop_counter = self.run_loop_counter + 1
 
                 # Do some soul searching.
-                self.sleep.wait(0.1)
-                self.sleep.clear()
+                sleep_wait(0.1)
+                sleep_clear()
 
                 # Were we asked to leave?
-                if self.stop.is_set():
+                if stop_is_set():
                     logger.debug("Inner thread loop terminated by stop()")
                     break
 
@@ -95,7 +100,7 @@ class KoLoopThread(KoThread):
                 # Do some work.
                 # noinspection PyBroadException
                 try:
-                    if self.execute() != LOOP_CONTINUE:
+                    if execute() != LOOP_CONTINUE:
                         logger.debug("Inner thread loop terminated "
                                      "by execute()")
                         result = 3
@@ -18,6 +18,12 @@ logger = logging.getLogger('p2p0mq.thread')
 class KoNetThread(KoLoopThread):
     """
     Base thread for network threads.
+
+    Attributes:
+        app_uuid (bytes):
+            The unique identifier of the local peer, copied from the
+            application at :meth:`~create` time (it does not change
+            after the database was read).
     """
     def __init__(self, app,
                  bind_address='127.0.0.1', bind_port=None,
@@ -33,6 +39,7 @@ class KoNetThread(KoLoopThread):
 
         # The local peer where we belong to.
         self.app = app
+        self.app_uuid = None
 
         # The context used to create sockets.
         self.context = context or Context.instance()
@@ -50,7 +57,7 @@ class KoNetThread(KoLoopThread):
 
     def create(self):
         """ Called at thread start to initialize the state. """
-        pass
+        self.app_uuid = self.app.uuid
 
     def terminate(self):
         """ Called at thread end to free resources. """
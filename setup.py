@@ -36,12 +36,17 @@ EXTRAS = {
         'sphinx_rtd_theme',
         'recommonmark',
         'm2r',
-        'coverage'
+        'coverage',
+        'yappi',
+        'pytest-xdist',
     ],
     'tests': [
         'mock',
         'nose',
     ],
+    'speedups': [
+        'msgpack',
+    ],
 }
 
 # The rest you shouldn't have to touch too much :)
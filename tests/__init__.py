@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import re
+
+# Each pytest-xdist worker gets its own range of ports.
+PORTS_PER_WORKER = 20
+
+
+def worker_port(port):
+    """
+    Computes a port that is unique to the current test worker.
+
+    When the tests run in parallel under pytest-xdist the name of the
+    worker (`gw0`, `gw1`, ...) is in the `PYTEST_XDIST_WORKER`
+    environment variable; outside xdist the port is returned unchanged.
+    """
+    match = re.search(r'\d+$', os.environ.get('PYTEST_XDIST_WORKER', ''))
+    if match is None:
+        return port
+    return port + PORTS_PER_WORKER * int(match.group())
@@ -1,4 +1,9 @@
 # https://stackoverflow.com/a/59141032/1742064
+#
+# When yappi is installed it profiles all threads in a single run
+# (wall clock) and the result is saved in callgrind format; otherwise
+# each thread is profiled with its own cProfile instance and the
+# results are merged.
 
 
 import threading
@@ -10,6 +15,11 @@ from time import time
 import threading
 import sys
 
+try:
+    import yappi
+except ImportError:
+    yappi = None
+
 # using different times to ensure the results reflect all threads
 SHORT = 0.5
 MED = 0.715874
@@ -29,7 +39,12 @@ class MyThreading(threading.Thread):
 
         Since we're in the current instance of each threading object at
         this point, we can run arbitrary number of threads & profile all of them
+
+        With yappi the threads are followed by the profiler started in
+        the main thread, so the target is simply called.
         """
+        if yappi is not None:
+            return super().run()
         try:
             if self._target:
                 # using the name attr. of our thread to ensure unique profile filenames
@@ -103,8 +118,20 @@ if __name__ == '__main__':
 
     import sys
     args = sys.argv[1:]
-    cProfile.run('main(args)', f'full_server_profile')
-    stats = Stats('full_server_profile')
-    stats.add('full_server_thread_T1')
-    stats.add('full_server_thread_T2')
-    stats.sort_stats('filename').print_stats()
+    if yappi is not None:
+        yappi.set_clock_type("wall")
+        yappi.start(builtins=True)
+        try:
+            main(args)
+        finally:
+            yappi.stop()
+        stats = yappi.get_func_stats()
+        stats.save('full_server_profile.callgrind', type='callgrind')
+        stats.sort('ttot').print_all()
+        yappi.get_thread_stats().print_all()
+    else:
+        cProfile.run('main(args)', f'full_server_profile')
+        stats = Stats('full_server_profile')
+        stats.add('full_server_thread_T1')
+        stats.add('full_server_thread_T2')
+        stats.sort_stats('filename').print_stats()
@@ -23,6 +23,8 @@ from p2p0mq.app.client import Sender
 from p2p0mq.app.server import Receiver
 from p2p0mq.app.local_peer import LocalPeer
 
+from tests import worker_port
+
 logger = logging.getLogger('tests.p2p0mq.net_comm')
 # handler = logging.StreamHandler()
 # handler.setLevel(1)
@@ -41,7 +43,7 @@ class TestNetCommNoAuth(TestCase):
 
         self.sender = Sender(
             app=self.app,
-            bind_port=19996,
+            bind_port=worker_port(19996),
             context=self.app.zmq_context
         )
         self.sender.create()
@@ -49,7 +51,7 @@ class TestNetCommNoAuth(TestCase):
 
         self.receiver = Receiver(
             app=self.app,
-            bind_port=19997,
+            bind_port=worker_port(19997),
             context=self.app.zmq_context
         )
         self.receiver.create()
@@ -74,36 +76,35 @@ class TestNetCommNoAuth(TestCase):
 
         for i in range(2):
             sleep(0.2)
-            socks = dict(poller.poll(200))
-            logger.debug('we have %d active sockets', len(socks))
-
-            if self.sender.socket in socks:
-                value = socks[self.sender.socket]
-                if value & zmq.POLLIN:
-                    data = self.sender.socket.recv_multipart()
-                    logger.debug(
-                        '<<<<<< SSS <<<<<<<< %r', data)
-                    received_by_sender.append(data)
-                if value & zmq.POLLOUT:
-                    if i == 0:
-                        to_send = [b"receiver", b'sender ok']
-                        self.sender.socket.send_multipart(to_send)
+            events = poller.poll(200)
+            logger.debug('we have %d active sockets', len(events))
+
+            for sock, value in events:
+                if sock is self.sender.socket:
+                    if value & zmq.POLLIN:
+                        data = self.sender.socket.recv_multipart()
                         logger.debug(
-                            '>>>>> SSS >>>>>> %r', to_send)
-
-            if self.receiver.socket in socks:
-                value = socks[self.receiver.socket]
-                if value & zmq.POLLIN:
-                    data = self.receiver.socket.recv_multipart()
-                    logger.debug(
-                        '<<<<<< RRR <<<<<<<< %r', data)
-                    received_by_receiver.append(data)
-                if value & zmq.POLLOUT:
-                    if i == 0:
-                        to_send = [b"sender", b'receiver ok']
-                        self.receiver.socket.send_multipart(to_send)
+                            '<<<<<< SSS <<<<<<<< %r', data)
+                        received_by_sender.append(data)
+                    if value & zmq.POLLOUT:
+                        if i == 0:
+                            to_send = [b"receiver", b'sender ok']
+                            self.sender.socket.send_multipart(to_send)
+                            logger.debug(
+                                '>>>>> SSS >>>>>> %r', to_send)
+
+                elif sock is self.receiver.socket:
+                    if value & zmq.POLLIN:
+                        data = self.receiver.socket.recv_multipart()
                         logger.debug(
-                            '>>>>> RRR >>>>>> %r', to_send)
+                            '<<<<<< RRR <<<<<<<< %r', data)
+                        received_by_receiver.append(data)
+                    if value & zmq.POLLOUT:
+                        if i == 0:
+                            to_send = [b"sender", b'receiver ok']
+                            self.receiver.socket.send_multipart(to_send)
+                            logger.debug(
+                                '>>>>> RRR >>>>>> %r', to_send)
         raise SkipTest
         self.assertListEqual(
             received_by_receiver, [[b'sender ok']])
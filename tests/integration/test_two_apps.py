@@ -9,7 +9,6 @@ import logging
 import os
 import shutil
 import tempfile
-from time import sleep
 from unittest import TestCase, SkipTest
 from unittest.mock import MagicMock
 
@@ -18,6 +17,8 @@ import zmq
 from p2p0mq.app.local_peer import LocalPeer
 from p2p0mq.peer import Peer
 
+from tests import worker_port
+
 LOG_LEVEL_HERE = logging.DEBUG # 1 # logging.WARNING #
 logging.getLogger().setLevel(LOG_LEVEL_HERE)
 if len(logging.getLogger().handlers) == 0:
@@ -38,7 +39,7 @@ logging.getLogger('p2p0mq.concerns').setLevel(logging.WARNING)
 # logging.getLogger('p2p0mq.app.c').setLevel(1)
 
 
-def make_app(tag, no_encryption=True):
+def make_app(tag, no_encryption=True, zmq_context=None):
     label = '%d~%d~%d~%d' % (tag, tag, tag, tag)
     app = LocalPeer(
         db_file_path=tempfile.mktemp(prefix='ko-%s-db_file_path-' % label),
@@ -48,22 +49,23 @@ def make_app(tag, no_encryption=True):
         no_encryption=no_encryption,
         config={},
         sender_address='127.0.0.1',
-        sender_port=8300+tag,
+        sender_port=worker_port(8300+tag),
         receiver_address='127.0.0.1',
-        receiver_port=8400+tag,
-        zmq_context=zmq.Context(),
+        receiver_port=worker_port(8400+tag),
+        zmq_context=zmq_context or zmq.Context(),
         zmq_monitor=True,
         app_uuid=label
     )
     return app
 
 
-def end_app(app):
+def end_app(app, destroy_context=True):
 
     app.stop.set()
     if app.is_alive():
         app.join()
-    app.zmq_context.destroy()
+    if destroy_context:
+        app.zmq_context.destroy(linger=0)
     if os.path.isfile(app.db_file_path):
         os.remove(app.db_file_path)
     if os.path.isdir(app.private_cert_dir):
@@ -75,17 +77,29 @@ def end_app(app):
 
 
 class TestTestee(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Each app needs a context of its own (a context has a single
+        # authentication handler) but the contexts are reused by all tests.
+        cls.context1 = zmq.Context(io_threads=1)
+        cls.context2 = zmq.Context(io_threads=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.context1.destroy(linger=0)
+        cls.context2.destroy(linger=0)
+
     def setUp(self):
-        self.testee1 = make_app(1, False)
-        self.testee2 = make_app(2, False)
+        self.testee1 = make_app(1, False, self.context1)
+        self.testee2 = make_app(2, False, self.context2)
 
     def tearDown(self):
-        end_app(self.testee1)
+        end_app(self.testee1, False)
         self.assertIsNone(self.testee1.receiver.socket)
         self.assertIsNone(self.testee1.sender.socket)
         self.testee1 = None
 
-        end_app(self.testee2)
+        end_app(self.testee2, False)
         self.assertIsNone(self.testee2.receiver.socket)
         self.assertIsNone(self.testee2.sender.socket)
         self.testee2 = None
@@ -116,10 +130,9 @@ class TestTestee(TestCase):
         # a message is send to the peer. After the proper authentication
         # the peer will create a structure of its own for the incoming peer
         # and acknowledge the message.
-        with self.testee1.peers_lock:
-            self.testee1.peers[peer.uuid] = peer
-
-        sleep(5)
+        self.testee2.peer_added.clear()
+        self.testee1.add_peer(peer)
 
+        self.assertTrue(self.testee2.peer_added.wait(timeout=5))
         self.assertEqual(len(self.testee2.peers), 1)
 
@@ -6,12 +6,9 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
-import os
-import shutil
-import tempfile
 import uuid
-from unittest import TestCase, SkipTest
-from unittest.mock import MagicMock, call
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
 
 import zmq
 
@@ -25,24 +22,55 @@ from p2p0mq.message_queue.fast import FastMessageQueue
 from p2p0mq.message_queue.slow import SlowMessageQueue
 from p2p0mq.peer import Peer
 
+from tests import worker_port
+
 logger = logging.getLogger('tests.p2p0mq.client')
 
+# The attribute lists are computed once; a list spec saves the
+# introspection of the class each time a mock is created.
+MESSAGE_SPEC = dir(Message)
+PEER_SPEC = dir(Peer)
+SLOW_QUEUE_SPEC = dir(SlowMessageQueue)
+FAST_QUEUE_SPEC = dir(FastMessageQueue)
+SOCKET_SPEC = dir(zmq.Socket)
+CONCERN_SPEC = dir(Concern)
+
 
 class TestTestee(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A single context is shared by all the tests in this class.
+        cls.context = zmq.Context()
+        cls.app_uuid = uuid.uuid4().hex.encode()
+        # Sockets created by the tests never wait for pending messages.
+        cls.context.setsockopt(zmq.LINGER, 0)
+        # The validation is replaced for the whole class and restored
+        # at the end; each test starts with messages that are valid.
+        cls.validate_patcher = patch.object(
+            Message, 'validate_messages_for_send')
+        cls.validate = cls.validate_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.validate_patcher.stop()
+        cls.context.destroy(linger=0)
+
     def setUp(self):
+        self.validate.reset_mock()
+        self.validate.return_value = True
         self.app = MagicMock(spec=LocalPeer)
-        self.app._uuid = uuid.uuid4().hex.encode()
-        self.app.uuid = self.app._uuid
+        self.app._uuid = self.app_uuid
+        self.app.uuid = self.app_uuid
         self.app.no_encryption = False
         self.testee = Sender(
             app=self.app,
-            bind_address=None
+            bind_address=None,
+            context=self.context
         )
 
     def tearDown(self):
         if self.testee.socket is not None:
             self.testee.socket.close()
-        self.testee.context.destroy()
         self.testee = None
 
     def test_init(self):
@@ -60,153 +88,158 @@ class TestTestee(TestCase):
 
     def test_create(self):
         self.testee.app.no_encryption = True
-        self.testee.bind_address = "tcp://127.0.0.1:19999"
+        self.testee.bind_address = "tcp://127.0.0.1:%d" % worker_port(19999)
         self.testee.create()
         self.assertIsInstance(self.testee.socket, zmq.Socket)
         self.assertEqual(self.testee.socket.getsockopt(zmq.LINGER), 0)
 
     def test_send_message(self):
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.valid_for_send.return_value = False
         with self.assertRaises(AssertionError):
             self.testee.send_message(message)
 
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.valid_for_send.return_value = True
-        message.handler = MagicMock(spec=Concern)
-        self.testee.socket = MagicMock(spec=zmq.Socket)
+        message.handler = MagicMock(spec_set=CONCERN_SPEC)
+        self.testee.socket = MagicMock(spec=SOCKET_SPEC)
         self.assertIsNone(self.testee.send_message(message))
         message.valid_for_send.assert_called_once()
         self.testee.socket.send_multipart.assert_called_once()
         message.handler.message_sent.assert_called_once()
 
-        message = MagicMock(spec=Message)
-        message.valid_for_send.return_value = True
-        message.handler = MagicMock(spec=Concern)
-        self.testee.socket = MagicMock(spec=zmq.Socket)
-        self.testee.socket.send_multipart.side_effect = zmq.error.ZMQError()
-        message.time_to_live = 1
-        self.app.tick = 2
-        message.handler.send_failed.return_value = 'x'
-        result = self.testee.send_message(message)
-        self.assertIsNone(result)
-        message.handler.message_dropped.assert_called_once_with(message)
-        message.handler.send_failed.assert_not_called()
-
-        message = MagicMock(spec=Message)
-        message.valid_for_send.return_value = True
-        message.handler = MagicMock(spec=Concern)
-        self.testee.socket = MagicMock(spec=zmq.Socket)
+        # The socket fails; the message is dropped if it has expired,
+        # otherwise the handler decides what to do with it.
         self.testee.socket.send_multipart.side_effect = zmq.error.ZMQError()
-        message.time_to_live = 3
         self.app.tick = 2
-        message.handler.send_failed.return_value = 'x'
-        result = self.testee.send_message(message)
-        self.assertEqual(result, 'x')
-        message.handler.message_dropped.assert_not_called()
+        for time_to_live, expected, dropped in ((1, None, True),
+                                                (3, 'x', False)):
+            with self.subTest(time_to_live=time_to_live):
+                message.reset_mock()
+                message.time_to_live = time_to_live
+                message.handler.send_failed.return_value = 'x'
+                self.assertEqual(self.testee.send_message(message), expected)
+                if dropped:
+                    message.handler.message_dropped.assert_called_once_with(
+                        message)
+                    message.handler.send_failed.assert_not_called()
+                else:
+                    message.handler.message_dropped.assert_not_called()
+                    message.handler.send_failed.assert_called_once()
 
     def test_execute_queue(self):
-        message1 = MagicMock(spec=Message)
-        message2 = MagicMock(spec=Message)
-        queue = MagicMock(spec=SlowMessageQueue)
+        message1 = MagicMock(spec_set=MESSAGE_SPEC)
+        message2 = MagicMock(spec_set=MESSAGE_SPEC)
+        queue = MagicMock(spec_set=SLOW_QUEUE_SPEC)
         queue.dequeue.return_value = [message1, message2]
         self.testee.send_message = MagicMock()
         self.testee.send_message.return_value = None
         self.testee.execute_queue(queue)
         self.assertEqual(self.testee.send_message.call_count, 2)
 
-        message1 = MagicMock(spec=Message)
-        message2 = MagicMock(spec=Message)
-        queue = MagicMock(spec=SlowMessageQueue)
+        message1 = MagicMock(spec_set=MESSAGE_SPEC)
+        message2 = MagicMock(spec_set=MESSAGE_SPEC)
+        queue = MagicMock(spec_set=SLOW_QUEUE_SPEC)
         queue.dequeue.return_value = [message1, message2]
-        ret_message = MagicMock(spec=Message)
+        ret_message = MagicMock(spec_set=MESSAGE_SPEC)
         self.testee.send_message.return_value = ret_message
         self.testee.execute_queue(queue)
         queue.enqueue.assert_called_with(ret_message)
         self.assertEqual(queue.enqueue.call_count, 2)
 
-    def test_connect_peers(self):
-        queue = SlowMessageQueue()
-        queue.empty = MagicMock()
-        queue.empty.return_value = True
+    def mock_connection_queue(self, queue, *entries):
+        """ Loads the mocked connection queue with the entries. """
+        queue.reset_mock(return_value=True, side_effect=True)
+        queue.empty.side_effect = [False] * len(entries) + [True]
+        queue.dequeue.side_effect = list(entries)
         self.testee.connection_queue = queue
-        self.testee.fast_queue = MagicMock()
+        return queue
+
+    def test_connect_peers(self):
+        mock_queue = MagicMock(spec_set=SLOW_QUEUE_SPEC)
+        socket = MagicMock(spec=SOCKET_SPEC)
+        fast_queue = MagicMock(spec_set=FAST_QUEUE_SPEC)
+        self.testee.socket = socket
+        self.testee.fast_queue = fast_queue
+
+        queue = self.mock_connection_queue(mock_queue)
         self.testee.connect_peers()
-        self.testee.fast_queue.assert_not_called()
+        fast_queue.enqueue.assert_not_called()
         queue.empty.assert_called_once()
 
-        queue = SlowMessageQueue()
-        queue.empty = MagicMock()
-        queue.empty.return_value = False
-        queue.dequeue = MagicMock()
-        queue.dequeue.return_value = [1, 2]
-        self.testee.connection_queue = queue
-        with self.assertRaises(AssertionError):
-            self.testee.connect_peers()
+        for entries in ([1, 2], [[1, 1], [1, 2]]):
+            with self.subTest(entries=entries):
+                self.mock_connection_queue(mock_queue, entries)
+                with self.assertRaises(AssertionError):
+                    self.testee.connect_peers()
 
+        # The same real queue is used by the scenarios below; each of
+        # them leaves it empty.
         queue = SlowMessageQueue()
-        queue.empty = MagicMock()
-        queue.empty.return_value = False
-        queue.dequeue = MagicMock()
-        queue.dequeue.return_value = [[1, 1], [1, 2]]
         self.testee.connection_queue = queue
-        with self.assertRaises(AssertionError):
-            self.testee.connect_peers()
-
-        message1 = MagicMock(spec=Message)
-        message2 = MagicMock(spec=Message)
-        peer1 = MagicMock(spec=Peer)
+        message1 = MagicMock(spec_set=MESSAGE_SPEC)
+        message2 = MagicMock(spec_set=MESSAGE_SPEC)
+        peer1 = MagicMock(spec_set=PEER_SPEC)
         peer1.uuid = '11111'
         peer1.address = 'a1'
-        peer2 = MagicMock(spec=Peer)
+        del peer1._first_connect
+        peer2 = MagicMock(spec_set=PEER_SPEC)
         peer2.uuid = '22222'
         peer2.address = 'a1'
-        queue = SlowMessageQueue()
+        del peer2._first_connect
         queue.enqueue({peer1: message1})
         queue.enqueue({peer2: message2})
-        self.testee.socket = MagicMock(spec=zmq.Socket)
-        self.testee.connection_queue = queue
-        self.assertFalse(hasattr(peer1,'_first_connect'))
-        self.assertFalse(hasattr(peer2,'_first_connect'))
-        self.testee.fast_queue = MagicMock(spec=FastMessageQueue)
+        self.assertNotIn('_first_connect', vars(peer1))
+        self.assertNotIn('_first_connect', vars(peer2))
         self.testee.connect_peers()
-        self.assertTrue(hasattr(peer1,'_first_connect'))
-        self.assertTrue(hasattr(peer2,'_first_connect'))
-        self.assertEqual(self.testee.socket.connect.call_count, 2)
-        self.testee.socket.connect.assert_called_with('a1')
-        self.assertEqual(self.testee.fast_queue.enqueue.call_count, 2)
-        self.testee.fast_queue.enqueue.assert_called_with(message2)
-
-        self.testee.connection_queue = SlowMessageQueue()
-        self.testee.socket = MagicMock(spec=zmq.Socket)
+        self.assertIn('_first_connect', vars(peer1))
+        self.assertIn('_first_connect', vars(peer2))
+        self.assertEqual(socket.connect.call_count, 2)
+        socket.connect.assert_called_with('a1')
+        self.assertEqual(fast_queue.enqueue.call_count, 2)
+        fast_queue.enqueue.assert_called_with(message2)
+        self.assertTrue(queue.empty())
+
+        peer1 = MagicMock(spec_set=PEER_SPEC)
+        peer1.uuid = '11111'
+        peer1.address = 'a1'
+        self.testee.enqueue_connect(peer1, message1)
+        self.assertEqual(len(queue), 1)
+        socket.reset_mock()
+        fast_queue.reset_mock()
+        self.testee.connect_peers()
+        self.assertTrue(queue.empty())
+        socket.connect.assert_called_once_with('a1')
+        fast_queue.enqueue.assert_called_once_with(message1)
+
+        self.testee.enqueue_connects([(peer1, message1), (peer2, message2)])
+        self.assertEqual(len(queue), 2)
+        socket.reset_mock()
+        fast_queue.reset_mock()
+        self.testee.connect_peers()
+        self.assertTrue(queue.empty())
+        self.assertEqual(socket.connect.call_count, 2)
+        fast_queue.enqueue.assert_called_with(message2)
+
+        socket.reset_mock()
         self.testee.connect_peers()
-        self.testee.socket.assert_not_called()
+        socket.assert_not_called()
 
-        self.testee.socket = MagicMock(spec=zmq.Socket)
-        peer1 = MagicMock(spec=Peer)
+        peer1 = MagicMock(spec_set=PEER_SPEC)
         peer1.uuid = '11111'
         peer1.address = 'a1'
         setattr(peer1, '_first_connect', peer1.uuid)
-        self.testee.connection_queue = MagicMock(spec=SlowMessageQueue)
-        self.testee.connection_queue.empty.side_effect = [False, True]
-        self.testee.connection_queue.dequeue.return_value = [{peer1: message1}]
-        self.testee.socket = MagicMock(spec=zmq.Socket)
+        socket.reset_mock()
+        self.mock_connection_queue(mock_queue, [{peer1: message1}])
         self.testee.connect_peers()
-        self.testee.socket.setsockopt.assert_not_called()
-        self.testee.socket.connect.assert_called_once_with('a1')
-        self.testee.fast_queue.enqueue.assert_called_with(message1)
+        socket.setsockopt.assert_not_called()
+        socket.connect.assert_called_once_with('a1')
+        fast_queue.enqueue.assert_called_with(message1)
 
         message1.handler = MagicMock()
-        self.testee.socket = MagicMock(spec=zmq.Socket)
-        peer1 = MagicMock(spec=Peer)
-        peer1.uuid = '11111'
-        peer1.address = 'a1'
-        setattr(peer1, '_first_connect', peer1.uuid)
-        self.testee.connection_queue = MagicMock(spec=SlowMessageQueue)
-        self.testee.connection_queue.empty.side_effect = [False, True]
-        self.testee.connection_queue.dequeue.return_value = [{peer1: message1}]
-        self.testee.socket = MagicMock(spec=zmq.Socket)
-        self.testee.socket.connect.side_effect = zmq.error.ZMQError()
+        socket.reset_mock()
+        socket.connect.side_effect = zmq.error.ZMQError()
+        self.mock_connection_queue(mock_queue, [{peer1: message1}])
         self.testee.connect_peers()
         message1.handler.send_failed.assert_called_once()
 
@@ -221,46 +254,35 @@ class TestTestee(TestCase):
         self.testee.connect_peers.assert_called_once()
 
     def test_enqueue(self):
-        Message.validate_messages_for_send = MagicMock()
-        Message.validate_messages_for_send.return_value = False
+        self.validate.return_value = False
         with self.assertRaises(AssertionError):
             self.testee.enqueue(1, 2)
 
-        Message.validate_messages_for_send.return_value = True
+        self.validate.return_value = True
         with self.assertRaises(ValidationError):
             self.testee.enqueue(1, 202020)
 
-        message = MagicMock(spec=Message)
-
-        self.testee.sleep = MagicMock()
-        self.testee.fast_queue.enqueue = MagicMock()
-        self.testee.medium_queue.enqueue = MagicMock()
-        self.testee.slow_queue.enqueue = MagicMock()
-        self.testee.enqueue(message, SPEED_MEDIUM)
-        self.testee.fast_queue.enqueue.assert_not_called()
-        self.testee.medium_queue.enqueue.assert_called_once()
-        self.testee.slow_queue.enqueue.assert_not_called()
-        self.testee.sleep.set.assert_called_once()
-
-        self.testee.sleep = MagicMock()
-        self.testee.fast_queue.enqueue = MagicMock()
-        self.testee.medium_queue.enqueue = MagicMock()
-        self.testee.slow_queue.enqueue = MagicMock()
-        self.testee.enqueue(message, SPEED_FAST)
-        self.testee.fast_queue.enqueue.assert_called_once()
-        self.testee.medium_queue.enqueue.assert_not_called()
-        self.testee.slow_queue.enqueue.assert_not_called()
-        self.testee.sleep.set.assert_called_once()
+        message = MagicMock(spec_set=MESSAGE_SPEC)
 
         self.testee.sleep = MagicMock()
-        self.testee.fast_queue.enqueue = MagicMock()
-        self.testee.medium_queue.enqueue = MagicMock()
-        self.testee.slow_queue.enqueue = MagicMock()
-        self.testee.enqueue(message, SPEED_SLOW)
-        self.testee.fast_queue.enqueue.assert_not_called()
-        self.testee.medium_queue.enqueue.assert_not_called()
-        self.testee.slow_queue.enqueue.assert_called_once()
-        self.testee.sleep.set.assert_called_once()
+        queues = {
+            SPEED_FAST: self.testee.fast_queue,
+            SPEED_MEDIUM: self.testee.medium_queue,
+            SPEED_SLOW: self.testee.slow_queue,
+        }
+        for queue in queues.values():
+            queue.enqueue = MagicMock()
+        for speed in (SPEED_MEDIUM, SPEED_FAST, SPEED_SLOW):
+            self.testee.sleep.reset_mock()
+            for queue in queues.values():
+                queue.enqueue.reset_mock()
+            self.testee.enqueue(message, speed)
+            for queue_speed, queue in queues.items():
+                if queue_speed == speed:
+                    queue.enqueue.assert_called_once()
+                else:
+                    queue.enqueue.assert_not_called()
+            self.testee.sleep.set.assert_called_once()
 
     def test_enqueue_all(self):
 
@@ -268,12 +290,12 @@ class TestTestee(TestCase):
         self.testee.enqueue_all()
         self.testee.sleep.set.assert_not_called()
 
-        self.testee.sleep = MagicMock()
+        self.testee.sleep.reset_mock()
         arg = {}
         self.testee.enqueue_all(requests=arg, replies=arg, routed=[])
         self.testee.sleep.set.assert_not_called()
 
-        self.testee.sleep = MagicMock()
+        self.testee.sleep.reset_mock()
         arg = {
             SPEED_FAST: [],
             SPEED_MEDIUM: [],
@@ -282,21 +304,19 @@ class TestTestee(TestCase):
         self.testee.enqueue_all(requests=arg, replies=arg, routed=[])
         self.testee.sleep.set.assert_not_called()
 
-        Message.validate_messages_for_send = MagicMock()
-        Message.validate_messages_for_send.return_value = False
-        self.testee.sleep = MagicMock()
+        self.validate.return_value = False
+        self.testee.sleep.reset_mock()
         arg = {
-            SPEED_FAST: [MagicMock(spec=Message)],
-            SPEED_MEDIUM: [MagicMock(spec=Message)],
-            SPEED_SLOW: [MagicMock(spec=Message)],
+            SPEED_FAST: [MagicMock(spec_set=MESSAGE_SPEC)],
+            SPEED_MEDIUM: [MagicMock(spec_set=MESSAGE_SPEC)],
+            SPEED_SLOW: [MagicMock(spec_set=MESSAGE_SPEC)],
         }
         with self.assertRaises(AssertionError):
             self.testee.enqueue_all(requests=arg, replies=arg, routed=[])
 
-        Message.validate_messages_for_send = MagicMock()
-        Message.validate_messages_for_send.return_value = True
-        self.testee.sleep = MagicMock()
-        message = MagicMock(spec=Message)
+        self.validate.return_value = True
+        self.testee.sleep.reset_mock()
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.to = '11111'
         arg = {
             SPEED_FAST: [message],
@@ -308,14 +328,12 @@ class TestTestee(TestCase):
 
     def enqueue_part(self, method, queue):
         message = MagicMock()
-        Message.validate_messages_for_send = MagicMock()
-        Message.validate_messages_for_send.return_value = False
+        self.validate.return_value = False
         with self.assertRaises(AssertionError):
             method(self.testee, message)
 
         message = MagicMock()
-        Message.validate_messages_for_send = MagicMock()
-        Message.validate_messages_for_send.return_value = True
+        self.validate.return_value = True
         queue.enqueue = MagicMock()
         self.testee.sleep = MagicMock()
         method(self.testee, message)
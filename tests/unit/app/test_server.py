@@ -6,9 +6,6 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
-import os
-import shutil
-import tempfile
 import uuid
 from unittest import TestCase, SkipTest
 from unittest.mock import MagicMock
@@ -20,22 +17,38 @@ from p2p0mq.app.local_peer import LocalPeer
 from p2p0mq.constants import MESSAGE_TYPE_ROUTE, MESSAGE_TYPE_REQUEST, MESSAGE_TYPE_REPLY
 from p2p0mq.message_queue.slow import SlowMessageQueue
 
+from tests import worker_port
+
 logger = logging.getLogger('tests.p2p0mq.server')
 
 
 class TestTestee(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A single context is shared by all the tests in this class.
+        cls.context = zmq.Context()
+        cls.app_uuid = uuid.uuid4().hex.encode()
+        # Sockets created by the tests never wait for pending messages.
+        cls.context.setsockopt(zmq.LINGER, 0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.context.destroy(linger=0)
+
     def setUp(self):
         self.app = MagicMock(spec=LocalPeer)
-        self.app._uuid = uuid.uuid4().hex.encode()
-        self.app.uuid = self.app._uuid
+        self.app._uuid = self.app_uuid
+        self.app.uuid = self.app_uuid
 
         self.testee = Receiver(
             app=self.app,
-            bind_address=None
+            bind_address=None,
+            context=self.context
         )
 
     def tearDown(self):
-        self.testee.context.destroy()
+        if self.testee.socket is not None:
+            self.testee.socket.close()
         self.testee = None
 
     def test_init(self):
@@ -80,7 +93,7 @@ class TestTestee(TestCase):
         with self.assertRaises(zmq.error.ZMQError):
             self.testee.bind_address = "--/--"
             self.testee.create()
-        self.testee.bind_address = "tcp://127.0.0.1:19998"
+        self.testee.bind_address = "tcp://127.0.0.1:%d" % worker_port(19998)
         self.testee.create()
         self.assertIsInstance(self.testee.socket, zmq.Socket)
         self.assertEqual(self.testee.socket.getsockopt(zmq.LINGER), 0)
@@ -17,11 +17,35 @@ from p2p0mq.app.local_peer import LocalPeer
 logger = logging.getLogger('tests.p2p0mq.app')
 
 
+def empty_directory(path):
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+
+
 class TestKoNetThreadNoDb(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The directories are created once; each test gets them empty.
+        cls.private_dir = tempfile.mkdtemp()
+        cls.public_dir = tempfile.mkdtemp()
+        cls.temp_cert_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.private_dir, ignore_errors=True)
+        shutil.rmtree(cls.public_dir, ignore_errors=True)
+        shutil.rmtree(cls.temp_cert_dir, ignore_errors=True)
+
     def setUp(self):
-        self.private_dir = tempfile.mkdtemp()
-        self.public_dir = tempfile.mkdtemp()
-        self.temp_cert_dir = tempfile.mkdtemp()
+        for path in (self.private_dir, self.public_dir, self.temp_cert_dir):
+            if os.path.isdir(path):
+                empty_directory(path)
+            else:
+                os.makedirs(path)
         self.testee = LocalPeer(
             config=None,
             private_cert_dir=self.private_dir,
@@ -29,14 +53,6 @@ class TestKoNetThreadNoDb(TestCase):
             temp_cert_dir=self.temp_cert_dir
         )
 
-    def tearDown(self):
-        if os.path.isdir(self.private_dir):
-            shutil.rmtree(self.private_dir)
-        if os.path.isdir(self.public_dir):
-            shutil.rmtree(self.public_dir)
-        if os.path.isdir(self.temp_cert_dir):
-            shutil.rmtree(self.temp_cert_dir)
-
     def test_init(self):
         self.testee = LocalPeer(
             config=None,
@@ -7,7 +7,7 @@ from __future__ import print_function
 import logging
 import threading
 from unittest import TestCase
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from p2p0mq.app.local_peer import LocalPeer
 from p2p0mq.concerns.ask_around import AskAroundConcern
@@ -17,25 +17,47 @@ from p2p0mq.peer import Peer
 
 logger = logging.getLogger('tests.p2p0mq.ask')
 
+# The attribute lists are computed once; a list spec saves the
+# introspection of the class each time a mock is created.
+LOCAL_PEER_SPEC = dir(LocalPeer)
+MESSAGE_SPEC = dir(Message)
+PEER_SPEC = dir(Peer)
+
+MESSAGE_FIELDS = ('source', 'to', 'previous_hop', 'next_hop',
+                  'command', 'kind', 'handler', 'payload')
+
 
 class TestAskAroundConcern(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The tests never hold the lock, so they can share it.
+        cls.peers_lock = threading.Lock()
+        # The concern keeps no state besides the app, which is replaced
+        # in each test.
+        cls.testee = AskAroundConcern()
+
     def setUp(self):
-        self.app = MagicMock(spec=LocalPeer)
-        self.testee = AskAroundConcern(app=self.app)
+        self.app = MagicMock(spec=LOCAL_PEER_SPEC)
+        self.testee.app = self.app
         self.app.tick = 11
         self.app.uuid = 99
-        self.app.peers_lock = threading.Lock()
+        self.app.peers_lock = self.peers_lock
         self.app.peers = {}
 
     def tearDown(self):
-        self.testee = None
+        self.testee.app = None
+
+    @staticmethod
+    def message_fields(message):
+        """ The attributes of a composed message that the tests check. """
+        return {name: getattr(message, name) for name in MESSAGE_FIELDS}
 
     def test_init(self):
         self.assertEqual(self.testee.name, 'ask around')
         self.assertEqual(self.testee.command_id, b'r')
 
     def test_compose_ask_around_message__not_too_often(self):
-        peer = MagicMock(spec=Peer)
+        peer = MagicMock(spec_set=PEER_SPEC)
         peer.next_ask_around_time = 10
         result = self.testee.compose_ask_around_message(
             peer=peer, exclude=[], breadcrumbs=None)
@@ -43,7 +65,7 @@ class TestAskAroundConcern(TestCase):
 
     def test_compose_ask_around_message__no_peers(self):
         self.app.peers_connected = []
-        peer = MagicMock(spec=Peer)
+        peer = MagicMock(spec_set=PEER_SPEC)
         peer.next_ask_around_time = None
         result = self.testee.compose_ask_around_message(
             peer=peer, exclude=[], breadcrumbs=None)
@@ -53,7 +75,7 @@ class TestAskAroundConcern(TestCase):
         self.assertEqual(len(result), 0)
 
     def test_compose_ask_around_message__one_peer_me(self):
-        peer = MagicMock(spec=Peer)
+        peer = MagicMock(spec_set=PEER_SPEC)
         peer.next_ask_around_time = None
         peer.uuid = '1'
 
@@ -67,10 +89,10 @@ class TestAskAroundConcern(TestCase):
         self.assertEqual(len(result), 0)
 
     def test_compose_ask_around_message__two_peers(self):
-        peer1 = MagicMock(spec=Peer)
+        peer1 = MagicMock(spec_set=PEER_SPEC)
         peer1.next_ask_around_time = None
         peer1.uuid = '1'
-        peer2 = MagicMock(spec=Peer)
+        peer2 = MagicMock(spec_set=PEER_SPEC)
         peer2.next_ask_around_time = None
         peer2.uuid = '2'
 
@@ -84,22 +106,25 @@ class TestAskAroundConcern(TestCase):
             peer=peer1, exclude=[], breadcrumbs=None)
         self.assertEqual(len(result), 1)
         speed, message = result[0]
-        self.assertEqual(message.source, self.app.uuid)
-        self.assertEqual(message.to, peer2.uuid)
-        self.assertIsNone(message.previous_hop)
-        self.assertEqual(message.next_hop, peer2.uuid)
-        self.assertEqual(message.command, b'r')
-        self.assertEqual(message.kind, MESSAGE_TYPE_REQUEST)
-        self.assertEqual(message.handler, self.testee)
-        self.assertEqual(message.payload['target'], peer1.uuid)
-        self.assertListEqual(
-            message.payload['breadcrumbs'], [self.app.uuid])
+        self.assertEqual(self.message_fields(message), {
+            'source': self.app.uuid,
+            'to': peer2.uuid,
+            'previous_hop': None,
+            'next_hop': peer2.uuid,
+            'command': b'r',
+            'kind': MESSAGE_TYPE_REQUEST,
+            'handler': self.testee,
+            'payload': {
+                'target': peer1.uuid,
+                'breadcrumbs': [self.app.uuid],
+            },
+        })
 
     def test_compose_ask_around_message__has_bread_crumbs(self):
-        peer1 = MagicMock(spec=Peer)
+        peer1 = MagicMock(spec_set=PEER_SPEC)
         peer1.next_ask_around_time = None
         peer1.uuid = '1'
-        peer2 = MagicMock(spec=Peer)
+        peer2 = MagicMock(spec_set=PEER_SPEC)
         peer2.next_ask_around_time = None
         peer2.uuid = '2'
 
@@ -113,64 +138,48 @@ class TestAskAroundConcern(TestCase):
             peer=peer1, exclude=[], breadcrumbs=['1', '2'])
         self.assertEqual(len(result), 1)
         speed, message = result[0]
-        self.assertEqual(message.source, self.app.uuid)
-        self.assertEqual(message.to, peer2.uuid)
-        self.assertIsNone(message.previous_hop)
-        self.assertEqual(message.next_hop, peer2.uuid)
-        self.assertEqual(message.command, b'r')
-        self.assertEqual(message.kind, MESSAGE_TYPE_REQUEST)
-        self.assertEqual(message.handler, self.testee)
-        self.assertEqual(message.payload['target'], peer1.uuid)
-        self.assertListEqual(
-            message.payload['breadcrumbs'], ['1', '2', self.app.uuid])
-
-    def test_process_request__no_payload(self):
-        message = MagicMock(spec=Message)
-        message.payload = {}
-        result = self.testee.process_request(message)
-        self.assertIsNone(result)
-
-    def test_process_request__no_breadcrumbs(self):
-        message = MagicMock(spec=Message)
-        message.payload = {
-            'target': 1
-        }
-        result = self.testee.process_request(message)
-        self.assertIsNone(result)
-
-    def test_process_request__no_target(self):
-        message = MagicMock(spec=Message)
-        message.payload = {
-            'breadcrumbs': 1
-        }
-        result = self.testee.process_request(message)
-        self.assertIsNone(result)
-
-    def test_process_request__same_target(self):
-        message = MagicMock(spec=Message)
+        self.assertEqual(self.message_fields(message), {
+            'source': self.app.uuid,
+            'to': peer2.uuid,
+            'previous_hop': None,
+            'next_hop': peer2.uuid,
+            'command': b'r',
+            'kind': MESSAGE_TYPE_REQUEST,
+            'handler': self.testee,
+            'payload': {
+                'target': peer1.uuid,
+                'breadcrumbs': ['1', '2', self.app.uuid],
+            },
+        })
+
+    def test_process_request__ignored(self):
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.previous_hop = 50
-        message.payload = {
-            'target': 99,
-            'breadcrumbs': 1
-        }
-        result = self.testee.process_request(message)
-        self.assertIsNone(result)
+        for label, payload in (
+                ('no payload', {}),
+                ('no breadcrumbs', {'target': 1}),
+                ('no target', {'breadcrumbs': 1}),
+                ('same target', {'target': 99, 'breadcrumbs': 1})):
+            with self.subTest(label):
+                message.payload = payload
+                result = self.testee.process_request(message)
+                self.assertIsNone(result)
 
     def test_process_request(self):
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.previous_hop = 50
         message.source = 777
         message.payload = {
             'target': 999,
             'breadcrumbs': 1
         }
-        self.testee.compose_ask_around_message = MagicMock()
-        self.testee.compose_ask_around_message.return_value = 999999
-        result = self.testee.process_request(message)
+        with patch.object(self.testee, 'compose_ask_around_message',
+                          return_value=999999):
+            result = self.testee.process_request(message)
         self.assertEqual(result, 999999)
 
     def test_process_request__known_target(self):
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.previous_hop = 50
         message.source = 777
         message.payload = {
@@ -180,7 +189,7 @@ class TestAskAroundConcern(TestCase):
         message.create_reply = MagicMock()
         message.create_reply.return_value = 88888
 
-        peer1 = MagicMock(spec=Peer)
+        peer1 = MagicMock(spec_set=PEER_SPEC)
         peer1.uuid = 999
         peer1.state_initial = True
         self.app.peers[999] = peer1
@@ -192,13 +201,13 @@ class TestAskAroundConcern(TestCase):
 
 
     def test_process_reply__no_payload(self):
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.payload = {}
         result = self.testee.process_reply(message)
         self.assertIsNone(result)
 
     def test_process_reply__no_breadcrumbs(self):
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.payload = {
             'target': 1
         }
@@ -206,7 +215,7 @@ class TestAskAroundConcern(TestCase):
         self.assertIsNone(result)
 
     def test_process_reply__no_target(self):
-        message = MagicMock(spec=Message)
+        message = MagicMock(spec_set=MESSAGE_SPEC)
         message.payload = {
             'breadcrumbs': 1
         }
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from p2p0mq.concerns.ask_around import AskAroundConcern
+from p2p0mq.concerns.heart_beat import HeartBeatConcern
+from p2p0mq.concerns.manager import ConcernsManager
+from p2p0mq.constants import SPEED_FAST, SPEED_SLOW
+from p2p0mq.message import Message
+from p2p0mq.message_queue.slow import SlowMessageQueue
+
+logger = logging.getLogger('tests.p2p0mq.manager')
+
+
+class TestConcernsManager(TestCase):
+    def setUp(self):
+        self.testee = ConcernsManager()
+
+    def tearDown(self):
+        self.testee = None
+
+    def test_add_concern(self):
+        concern = AskAroundConcern()
+        self.testee.add_concern(concern)
+        self.assertIs(concern.app, self.testee)
+        self.assertIs(self.testee.concerns[b'r'], concern)
+        self.assertEqual(self.testee.request_dispatch[b'r'],
+                         (concern, concern.process_request))
+        self.assertEqual(self.testee.reply_dispatch[b'r'],
+                         (concern, concern.process_reply))
+        self.assertEqual(self.testee.execution_order,
+                         ((concern, concern.execute),))
+
+    def test_assign_concerns(self):
+        self.testee.add_concern(AskAroundConcern())
+        concern = HeartBeatConcern()
+        self.testee.concerns = {concern.command_id: concern}
+        self.assertEqual(set(self.testee.request_dispatch), {b'hb'})
+        self.assertEqual(set(self.testee.reply_dispatch), {b'hb'})
+        self.assertEqual(self.testee.execution_order,
+                         ((concern, concern.execute),))
+
+    def test_process_requests(self):
+        concern = AskAroundConcern()
+        self.testee.add_concern(concern)
+        self.testee.note_traffic = MagicMock()
+        self.testee.tick = 1
+        reply = MagicMock(spec=Message)
+
+        queue = SlowMessageQueue()
+        queue.enqueue(Message(command=b'r'))
+        with patch.object(concern, 'process_request',
+                          return_value=(SPEED_FAST, reply)):
+            self.testee.rebuild_dispatch()
+            result = self.testee.process_requests(queue)
+        self.assertEqual(result[SPEED_FAST], [reply])
+        self.assertEqual(result[SPEED_SLOW], [])
+
+        # An unknown priority does not end up in some other queue.
+        queue.enqueue(Message(command=b'r'))
+        with patch.object(concern, 'process_request',
+                          return_value=(SPEED_SLOW - 1, reply)):
+            self.testee.rebuild_dispatch()
+            with self.assertRaises(ValueError):
+                self.testee.process_requests(queue)
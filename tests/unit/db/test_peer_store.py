@@ -5,14 +5,21 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import logging
+import os
 import sqlite3
+import tempfile
+import threading
 from unittest import TestCase
 from unittest.mock import MagicMock
 from time import time, sleep
 
 from p2p0mq.constants import SYNC_DB_INTERVAL
-from p2p0mq.peer_store import PeerStore, SQLITE_PEERS_TABLE, SQLITE_META_TABLE
-from p2p0mq.peer import Peer
+from p2p0mq.peer_store import (
+    PeerStore, PeerMap, SQLITE_PEERS_TABLE, SQLITE_META_TABLE
+)
+from p2p0mq.peer import (
+    Peer, INITIAL, CONNECTING, CONNECTED, ROUTED, UNREACHABLE, NO_CONNECTION
+)
 
 logger = logging.getLogger('tests.p2p0mq.db')
 
@@ -30,6 +37,42 @@ class TestKoNetThreadNoDb(TestCase):
         self.assertIsNone(self.testee.uuid)
         self.assertIsNone(self.testee.db_created)
 
+    def test_peers_by_state(self):
+        properties = {
+            INITIAL: 'peers_in_initial_state',
+            CONNECTING: 'peers_connecting',
+            CONNECTED: 'peers_connected',
+            ROUTED: 'peers_routed',
+            UNREACHABLE: 'peers_unreachable',
+            NO_CONNECTION: 'peers_no_connection',
+        }
+        self.assertFalse(self.testee.peer_added.is_set())
+        peers = {}
+        for state in properties:
+            peer = Peer(uuid=('%d' % state).encode())
+            peer.conn_state = state
+            self.testee.add_peer(peer)
+            peers[state] = peer
+        for state, name in properties.items():
+            self.assertEqual(getattr(self.testee, name), [peers[state]])
+        self.assertTrue(self.testee.peer_added.is_set())
+
+        peers[INITIAL].conn_state = CONNECTED
+        self.assertEqual(self.testee.peers_in_initial_state, [])
+        self.assertEqual(set(self.testee.peers_connected),
+                         {peers[INITIAL], peers[CONNECTED]})
+        self.testee.take_peer(peers[CONNECTED])
+        self.assertEqual(self.testee.peers_connected, [peers[INITIAL]])
+
+    def test_note_traffic(self):
+        peer = Peer(uuid=b'1111')
+        self.testee.add_peer(peer)
+        messages = [MagicMock(previous_hop=b'1111'),
+                    MagicMock(previous_hop=b'2222')]
+        self.testee.note_traffic(messages, 10)
+        self.assertEqual(peer.last_rx_time, 10)
+        self.assertNotIn(b'2222', self.testee.peers)
+
     def test_table_exists(self):
         cursor = MagicMock()
         name = "ttt"
@@ -82,8 +125,67 @@ class TestKoNetThreadDb(TestCase):
         self.cursor = self.db.cursor()
 
     def tearDown(self):
+        self.testee.terminate_db()
         self.db.close()
 
+    def test_pragma_applied(self):
+        db_file = tempfile.mktemp(prefix='p2p0mq-test-db-')
+        testee = PeerStore(db_file_path=db_file, db_sync_level='off')
+        try:
+            with testee._db_lock:
+                conn = testee.db_connection()
+                self.assertEqual(
+                    conn.execute("PRAGMA journal_mode;").fetchone()[0],
+                    'wal')
+                self.assertEqual(
+                    conn.execute("PRAGMA synchronous;").fetchone()[0], 0)
+        finally:
+            testee.terminate_db()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.isfile(db_file + suffix):
+                    os.remove(db_file + suffix)
+
+        with self.assertRaises(ValueError):
+            PeerStore(db_sync_level='sometimes')
+
+    def test_concurrent_reader_during_write(self):
+        db_file = tempfile.mktemp(prefix='p2p0mq-test-db-')
+        testee = PeerStore(db_file_path=db_file)
+        errors = []
+        done = threading.Event()
+
+        def reader():
+            conn = sqlite3.connect(db_file)
+            try:
+                while not done.is_set():
+                    conn.execute("SELECT COUNT(*) FROM %s;" %
+                                 SQLITE_PEERS_TABLE).fetchone()
+            except sqlite3.Error as exc:
+                errors.append(exc)
+            finally:
+                conn.close()
+
+        try:
+            testee.start_db()
+            thread = threading.Thread(target=reader)
+            thread.start()
+            try:
+                for i in range(20):
+                    peer = Peer(uuid=b'peer%d' % i, host='host', port=i)
+                    testee.peers[peer.uuid] = peer
+                    testee.sync_database(force=True)
+            finally:
+                done.set()
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertTrue(all(peer.db_id is not None
+                                for peer in testee.peers.values()))
+        finally:
+            testee.terminate_db()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.isfile(db_file + suffix):
+                    os.remove(db_file + suffix)
+
     def test_table_exists(self):
         self.assertFalse(self.testee.table_exists(self.cursor, "ttt"))
         self.cursor.execute("CREATE TABLE ttt (id INTEGER PRIMARY KEY);")
@@ -122,6 +224,22 @@ class TestKoNetThreadDb(TestCase):
         self.testee.read_metadata()
         self.assertTrue(hasattr(self.testee, "ggggg"))
         self.assertEqual(self.testee.ggggg, "XXX")
+        self.assertIsInstance(self.testee.db_created, float)
+        self.assertIsInstance(self.testee.uuid, bytes)
+
+    def test_read_metadata_new_database(self):
+        self.testee.read_metadata()
+        self.assertIsInstance(self.testee.uuid, bytes)
+        self.assertTrue(self.testee.table_exists(
+            self.cursor, SQLITE_META_TABLE))
+        self.assertTrue(self.testee.table_exists(
+            self.cursor, SQLITE_PEERS_TABLE))
+
+        # The first sync can already save the peers.
+        peer = Peer(uuid=b'peer1', host='host', port=8000)
+        self.testee.peers[peer.uuid] = peer
+        self.assertEqual(len(self.testee.sync_database(force=True)), 0)
+        self.assertEqual(peer.db_id, 1)
 
     def test_sync_database(self):
         self.assertEqual(len(self.testee.peers), 0)
@@ -136,10 +254,13 @@ class TestKoNetThreadDb(TestCase):
         self.assertEqual(len(result), 0)
         self.assertEqual(len(self.testee.peers), 0)
 
+        conn = self.testee._db_conn
+        self.assertIsNotNone(conn)
         result = self.testee.sync_database()
         self.assertEqual(len(result), 0)
         self.assertLessEqual(sync_time+SYNC_DB_INTERVAL,
                              self.testee.next_peer_db_sync_time)
+        self.assertIs(self.testee._db_conn, conn)
 
         peer = MagicMock(spec=Peer)
         peer.uuid = "111"
@@ -160,4 +281,175 @@ class TestKoNetThreadDb(TestCase):
         self.assertEqual(result[1], "111")
         self.assertEqual(result[2], "host")
         self.assertEqual(result[3], 888)
+        self.assertEqual(peer.db_id, 1)
+        self.assertFalse(self.testee.db_connection().in_transaction)
+
+    def test_sync_database_many(self):
+        self.testee.sync_database(force=True)
+        for i in range(5):
+            peer = Peer(uuid=b'peer%d' % i, host='host', port=8000 + i)
+            self.testee.peers[peer.uuid] = peer
+        self.assertEqual(len(self.testee.sync_database(force=True)), 0)
+        self.cursor.execute("SELECT peer_id, uuid, port FROM %s "
+                            "ORDER BY peer_id;" % SQLITE_PEERS_TABLE)
+        rows = self.cursor.fetchall()
+        self.assertEqual(len(rows), 5)
+        for peer_id, peer_uuid, port in rows:
+            peer = self.testee.peers[peer_uuid]
+            self.assertEqual(peer.db_id, peer_id)
+            self.assertEqual(peer.port, port)
+
+        # Nothing new to save the second time.
+        self.assertEqual(len(self.testee.sync_database(force=True)), 0)
+        self.cursor.execute("SELECT COUNT(*) FROM %s;" % SQLITE_PEERS_TABLE)
+        self.assertEqual(self.cursor.fetchone()[0], 5)
+
+
+class TestPeerMap(TestCase):
+    def setUp(self):
+        self.testee = PeerMap()
+
+    def test_init(self):
+        self.assertIsInstance(self.testee, dict)
+        self.assertEqual(len(self.testee), 0)
+        for state in (INITIAL, CONNECTING, CONNECTED, NO_CONNECTION):
+            self.assertEqual(self.testee.by_state[state], set())
+
+    def test_add_remove(self):
+        peer = Peer(uuid=b'1111')
+        self.testee[peer.uuid] = peer
+        self.assertIs(peer.peer_map, self.testee)
+        self.assertEqual(self.testee.by_state[INITIAL], {b'1111'})
+
+        self.assertIs(self.testee.pop(peer.uuid), peer)
+        self.assertIsNone(peer.peer_map)
+        self.assertEqual(self.testee.by_state[INITIAL], set())
+
+        self.testee.update({peer.uuid: peer})
+        self.assertEqual(self.testee.by_state[INITIAL], {b'1111'})
+        del self.testee[peer.uuid]
+        self.assertEqual(self.testee.by_state[INITIAL], set())
+
+    def test_state_change(self):
+        peer = Peer(uuid=b'1111')
+        self.testee[peer.uuid] = peer
+        peer.state_connecting = True
+        self.assertEqual(self.testee.by_state[INITIAL], set())
+        self.assertEqual(self.testee.by_state[CONNECTING], {b'1111'})
+        peer.conn_state = CONNECTED
+        self.assertEqual(self.testee.by_state[CONNECTING], set())
+        self.assertEqual(self.testee.by_state[CONNECTED], {b'1111'})
+        peer.state_no_connection = True
+        self.assertEqual(self.testee.by_state[CONNECTED], set())
+        self.assertEqual(self.testee.by_state[NO_CONNECTION], {b'1111'})
+
+        self.testee.clear()
+        peer.state_initial = True
+        self.assertEqual(self.testee.by_state[INITIAL], set())
+
+    def test_host_change(self):
+        peer = Peer(uuid=b'1111')
+        self.testee[peer.uuid] = peer
+        self.assertEqual(self.testee.with_host, set())
+        peer.host = '127.0.0.1'
+        self.assertEqual(self.testee.with_host, {b'1111'})
+        peer.host = None
+        self.assertEqual(self.testee.with_host, set())
+
+        peer = Peer(uuid=b'2222', host='127.0.0.1')
+        self.testee[peer.uuid] = peer
+        self.assertEqual(self.testee.with_host, {b'2222'})
+        self.testee.pop(peer.uuid)
+        self.assertEqual(self.testee.with_host, set())
+
+    def test_to_connect(self):
+        peer = Peer(uuid=b'1111')
+        self.testee[peer.uuid] = peer
+        self.assertEqual(self.testee.to_connect, set())
+        peer.host = '127.0.0.1'
+        self.assertEqual(self.testee.to_connect, {b'1111'})
+        peer.state_connecting = True
+        self.assertEqual(self.testee.to_connect, set())
+        peer.state_initial = True
+        self.assertEqual(self.testee.to_connect, {b'1111'})
+        peer.host = None
+        self.assertEqual(self.testee.to_connect, set())
+
+        peer = Peer(uuid=b'2222', host='127.0.0.1')
+        self.testee[peer.uuid] = peer
+        self.assertEqual(self.testee.to_connect, {b'2222'})
+        del self.testee[peer.uuid]
+        self.assertEqual(self.testee.to_connect, set())
+
+    def test_snapshot(self):
+        self.assertEqual(self.testee.snapshot(), ())
+        peer1 = Peer(uuid=b'1111')
+        peer2 = Peer(uuid=b'2222')
+        peer2.conn_state = CONNECTED
+        self.testee[peer1.uuid] = peer1
+        self.testee[peer2.uuid] = peer2
+        snapshot = self.testee.snapshot()
+        self.assertIsInstance(snapshot, tuple)
+        self.assertEqual(set(snapshot), {peer1, peer2})
+        self.assertEqual(self.testee.snapshot((CONNECTED,)), (peer2,))
+        self.assertEqual(
+            set(self.testee.snapshot((INITIAL, CONNECTED))), {peer1, peer2})
+        self.testee.pop(peer1.uuid)
+        self.assertEqual(set(snapshot), {peer1, peer2})
+        self.assertEqual(self.testee.snapshot((INITIAL,)), ())
+
+    def test_schedule(self):
+        peer1 = Peer(uuid=b'1111')
+        peer1.conn_state = CONNECTED
+        peer1.next_heart_beat_time = 10
+        self.testee[peer1.uuid] = peer1
+        schedule = self.testee.add_schedule((CONNECTED,))
+        self.assertEqual(len(schedule), 1)
+
+        peer2 = Peer(uuid=b'2222')
+        self.testee[peer2.uuid] = peer2
+        self.assertEqual(len(schedule), 1)
+        peer2.conn_state = CONNECTED
+        self.assertEqual(len(schedule), 1)
+        peer2.next_heart_beat_time = 5
+
+        self.assertFalse(schedule.is_due(4))
+        self.assertFalse(schedule.is_due(5, False))
+        self.assertTrue(schedule.is_due(5))
+        self.assertEqual(schedule.pop_due(self.testee, 4), [])
+        self.assertEqual(schedule.pop_due(self.testee, 5, False), [])
+        self.assertEqual(schedule.pop_due(self.testee, 5, limit=0), [])
+        self.assertEqual(schedule.pop_due(self.testee, 5), [peer2])
+        self.assertEqual(schedule.pop_due(self.testee, 5), [])
+
+        # Stale entries are skipped.
+        peer1.next_heart_beat_time = 20
+        self.assertEqual(schedule.pop_due(self.testee, 15), [])
+        peer1.state_unreachable = True
+        peer2.next_heart_beat_time = 16
+        self.testee.pop(peer2.uuid)
+        self.assertEqual(schedule.pop_due(self.testee, 100), [])
+        self.assertEqual(len(schedule), 0)
+        self.assertFalse(schedule.is_due(100))
+
+        self.testee.remove_schedule(schedule)
+        self.assertEqual(self.testee.schedules, [])
+
+    def test_deferred_reschedule(self):
+        schedule = self.testee.add_schedule((CONNECTED,))
+        peers = [Peer(uuid=b'%04d' % i) for i in range(10)]
+        for peer in peers:
+            peer.conn_state = CONNECTED
+            self.testee[peer.uuid] = peer
+        self.assertEqual(len(schedule), 0)
 
+        with self.testee.deferred_reschedule():
+            for i, peer in enumerate(peers):
+                peer.next_heart_beat_time = 10 - i
+                peer.next_heart_beat_time = 30 - i
+            self.testee.pop(peers[0].uuid)
+            self.assertEqual(len(schedule), 0)
+        self.assertEqual(len(schedule), 9)
+        self.assertEqual(schedule.pop_due(self.testee, 20), [])
+        self.assertEqual(schedule.pop_due(self.testee, 100),
+                         list(reversed(peers[1:])))
@@ -9,14 +9,16 @@ import logging
 import os
 import shutil
 import tempfile
+from copy import copy
 from unittest import TestCase, SkipTest
 from unittest.mock import MagicMock
 
-from umsgpack import packb
+from umsgpack import packb, unpackb
 
 from p2p0mq.app.local_peer import LocalPeer
 from p2p0mq.concerns.base import Concern
 from p2p0mq.constants import MESSAGE_TYPE_REQUEST, MESSAGE_TYPE_REPLY
+from p2p0mq import message as message_module
 from p2p0mq.message import Message
 
 logger = logging.getLogger('tests.p2p0mq.message')
@@ -87,13 +89,43 @@ class TestTestee(TestCase):
             }
         )
 
+        payload = {'alpha': 1}
+        self.testee = Message(payload=payload)
+        self.assertIs(self.testee.payload, payload)
+
+    def test_copy(self):
+        result = copy(self.testee)
+        self.assertIsInstance(result, Message)
+        self.assertIsNot(result, self.testee)
+        for name in Message.__slots__:
+            self.assertEqual(getattr(result, name),
+                             getattr(self.testee, name))
+        result.to = 'other'
+        self.assertEqual(self.testee.to, 'to')
+        self.assertIs(result.payload, self.testee.payload)
+
+    def test_copy_to(self):
+        result = self.testee.copy_to('other')
+        self.assertIsInstance(result, Message)
+        self.assertEqual(result.to, 'other')
+        self.assertEqual(result.next_hop, 'other')
+        self.assertEqual(result.source, self.testee.source)
+        self.assertEqual(result.command, self.testee.command)
+        self.assertIs(result.payload, self.testee.payload)
+        self.assertNotEqual(result.message_id, self.testee.message_id)
+        self.assertEqual(self.testee.to, 'to')
+
+        result = self.testee.copy_to('other', 'via')
+        self.assertEqual(result.to, 'other')
+        self.assertEqual(result.next_hop, 'via')
+
     def test_encode(self):
         bbb = self.testee.encode('uuid')
         self.assertIsInstance(bbb, tuple)
         self.assertEqual(len(bbb), 6)
         self.assertEqual(bbb[0], 'next_hop')
         self.assertEqual(bbb[1], 'src')
-        self.assertEqual(bbb[2], b'')
+        self.assertEqual(bbb[2], 'to')
         self.assertEqual(bbb[3], b'\01')
         self.assertEqual(bbb[4], 'command')
         self.assertIn(b'alpha', bbb[5])
@@ -101,6 +133,68 @@ class TestTestee(TestCase):
         self.assertIn(b'gamma', bbb[5])
         self.assertIn(b'delta', bbb[5])
 
+        # Frames that the receiver can infer are left empty.
+        self.testee.next_hop = 'to'
+        bbb = self.testee.encode('src')
+        self.assertEqual(bbb[0], 'to')
+        self.assertEqual(bbb[1], b'')
+        self.assertEqual(bbb[2], b'')
+
+    def test_encode_cache(self):
+        bbb = self.testee.encode('uuid')
+        self.assertEqual(unpackb(bbb[-1]),
+                         [self.testee.message_id, self.testee.payload])
+        again = self.testee.encode('uuid')
+        self.assertIs(again[-1], bbb[-1])
+
+        self.testee.payload = {'other': 1}
+        again = self.testee.encode('uuid')
+        self.assertEqual(unpackb(again[-1]),
+                         [self.testee.message_id, {'other': 1}])
+        self.testee.message_id = 7
+        again = self.testee.encode('uuid')
+        self.assertEqual(unpackb(again[-1]), [7, {'other': 1}])
+
+        raw = [b'ph', b'src', b'', b'\01', b'command', packb([9, {'a': 1}])]
+        message = Message.parse(raw, b'uuid')
+        self.assertEqual(message.message_id, 9)
+        self.assertEqual(message.payload, {'a': 1})
+        message.to = b'other'
+        bbb = message.encode(b'uuid')
+        self.assertEqual(len(bbb), 6)
+        self.assertIs(bbb[-1], raw[5])
+
+        raw[5] = packb(9)
+        self.assertIsNone(Message.parse(raw, b'uuid'))
+        self.assertIsNone(Message.parse(raw[:5], b'uuid'))
+
+    def test_packer(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise SkipTest("msgpack is not installed")
+        # The C implementation is preferred and it produces the same
+        # wire format as umsgpack.
+        self.assertIs(message_module.msgpack, msgpack)
+        value = [3, {'text': 'abc', 'raw': b'abc', 'list': [1.5, None]}]
+        self.assertEqual(message_module.packb(value), packb(value))
+        self.assertEqual(message_module.unpackb(packb(value)), value)
+
+        # Keys other than strings decode with either implementation.
+        value = [4, {1: 'x', b'k': 2}]
+        self.assertEqual(message_module.unpackb(packb(value)), value)
+        self.assertEqual(unpackb(message_module.packb(value)), value)
+
+    def test_parse_payload(self):
+        raw = [b'ph', b'src', b'', b'\01', b'command',
+               message_module.packb([9, {1: 'x'}])]
+        message = Message.parse(raw, b'uuid')
+        self.assertEqual(message.payload, {1: 'x'})
+
+        # A truncated body is rejected, whatever the implementation.
+        raw[5] = raw[5][:-1]
+        self.assertIsNone(Message.parse(raw, b'uuid'))
+
     def test_valid_for_send(self):
 
         msg = Message()
@@ -145,3 +239,10 @@ class TestTestee(TestCase):
         )
         self.assertTrue(msg.valid_for_send(app=self.app))
 
+        self.assertTrue(msg.valid_for_send(app=self.app, verbose=False))
+        msg.time_to_live = 1
+        self.assertFalse(msg.valid_for_send(app=self.app, verbose=False))
+
+        self.app.skip_validation = True
+        self.assertTrue(Message().valid_for_send(app=self.app))
+        self.assertTrue(Message().valid_for_send(app=self.app, verbose=False))
@@ -7,9 +7,10 @@ from __future__ import print_function
 import logging
 import threading
 from unittest import TestCase
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from p2p0mq.concerns.ask_around import AskAroundConcern
+from p2p0mq.concerns.manager import ConcernsManager
 from p2p0mq.message import Message
 from p2p0mq.message_queue.slow import SlowMessageQueue
 from p2p0mq.router import Router
@@ -64,9 +65,47 @@ class TestKoNetThreadNoDb(TestCase):
         cm = MagicMock(spec=AskAroundConcern)
         cm.compose_ask_around_message.return_value = [MagicMock(spec=Message)]
         self.testee.concerns = {
-            "ask around": cm
+            AskAroundConcern.command_id: cm
         }
         self.testee.drop_routed_message = MagicMock()
         result = self.testee.process_routes(queue)
         self.assertEqual(len(result), 2)
         self.assertEqual(self.testee.drop_routed_message.call_count, 2)
+
+        # The dropped messages are handed over all at once.
+        queue.enqueue([message1, message2])
+        self.testee.drop_routed_messages = MagicMock()
+        self.testee.process_routes(queue)
+        self.testee.drop_routed_messages.assert_called_once_with(
+            [message1, message2])
+
+    def test_process_routes_ask_around(self):
+        # The concern is found under its command id, as added by
+        # the concerns manager.
+        class Testee(ConcernsManager, Router):
+            pass
+
+        self.testee = Testee()
+        concern = AskAroundConcern()
+        self.testee.add_concern(concern)
+        self.testee.uuid = '123'
+        self.testee.peers = {}
+        self.testee.peers_lock = threading.Lock()
+        self.testee.tick = 9
+        self.testee.drop_routed_messages = MagicMock()
+
+        queue = SlowMessageQueue()
+        message = MagicMock(spec=Message)
+        message.to = 1111
+        message.time_to_live = 10
+        message.previous_hop = 888
+        message.source = 888
+        queue.enqueue(message)
+        ask = MagicMock(spec=Message)
+        with patch.object(concern, 'compose_ask_around_message',
+                          return_value=[ask]) as compose:
+            result = self.testee.process_routes(queue)
+        self.assertEqual(result, [ask])
+        compose.assert_called_once_with(
+            self.testee.peers[1111], [888, 888])
+        self.testee.drop_routed_messages.assert_called_once_with([message])
@@ -77,6 +77,20 @@ class TestKoNetThreadNoDb(TestCase):
     def test_cert_pair_check_gen(self):
         raise SkipTest("lazy")
 
+    def test_cert_pair_check_gen_public_from_private(self):
+        self.testee.prepare_cert_store("1x1")
+        public_key, secret_key = zmq.auth.load_certificate(
+            self.testee.private_file)
+        os.remove(self.testee.public_file)
+
+        self.assertEqual(self.testee.cert_pair_check_gen("1x1"),
+                         (self.testee.public_file, self.testee.private_file))
+        with open(self.testee.public_file, 'rb') as fin:
+            self.assertNotIn(b'secret-key', fin.read())
+        self.assertEqual(
+            zmq.auth.load_certificate(self.testee.public_file),
+            (public_key, None))
+
     def test_cert_file_by_uuid(self):
         result = self.testee.cert_file_by_uuid(uuid="1", public=True)
         self.assertEqual(result, os.path.join(
@@ -84,6 +98,97 @@ class TestKoNetThreadNoDb(TestCase):
         result = self.testee.cert_file_by_uuid(uuid="1", public=False)
         self.assertEqual(result, os.path.join(
             self.private_dir, "1.key_secret"))
+        result = self.testee.cert_file_by_uuid(uuid=b"1", public=True)
+        self.assertEqual(result, os.path.join(
+            self.public_dir, "1.key"))
+
+        self.testee.public_cert_dir = self.temp_cert_dir
+        result = self.testee.cert_file_by_uuid(uuid="1", public=True)
+        self.assertEqual(result, os.path.join(
+            self.temp_cert_dir, "1.key"))
+
+        # An equal path that is a different string still uses the cache.
+        self.testee.public_cert_dir = ''.join(self.temp_cert_dir)
+        self.assertIs(self.testee.cert_file_by_uuid(uuid="1", public=True),
+                      result)
+
+    def test_cert_key_by_uuid(self):
+        self.assertIsNone(self.testee.cert_key_by_uuid(uuid="1x1"))
+        self.testee.prepare_cert_store("1x1")
+        public_key, secret_key = zmq.auth.load_certificate(
+            self.testee.private_file)
+
+        with patch('p2p0mq.security.zmq.auth.load_certificate',
+                   wraps=zmq.auth.load_certificate) as load:
+            self.assertEqual(self.testee.cert_key_by_uuid(uuid="1x1"),
+                             public_key)
+            self.assertEqual(self.testee.cert_key_by_uuid(uuid=b"1x1"),
+                             public_key)
+            self.assertEqual(
+                self.testee.cert_key_by_uuid(uuid="1x1", public=False),
+                secret_key)
+            self.assertEqual(load.call_count, 2)
+
+            stat = os.stat(self.testee.public_file)
+            os.utime(self.testee.public_file,
+                     ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            self.assertEqual(self.testee.cert_key_by_uuid(uuid="1x1"),
+                             public_key)
+            self.assertEqual(load.call_count, 3)
+
+        os.remove(self.testee.public_file)
+        self.assertIsNone(self.testee.cert_key_by_uuid(uuid="1x1"))
+        self.assertNotIn(self.testee.public_file, self.testee.cert_keys)
+
+    def test_load_all_public_keys(self):
+        self.assertEqual(self.testee.load_all_public_keys(), {})
+        self.testee.prepare_cert_store("1x1")
+        with open(os.path.join(self.public_dir, "notes.txt"), "w") as fout:
+            fout.write("not a certificate")
+        public_key, secret_key = zmq.auth.load_certificate(
+            self.testee.public_file)
+
+        self.assertEqual(self.testee.load_all_public_keys(),
+                         {"1x1": public_key})
+        with patch('p2p0mq.security.zmq.auth.load_certificate') as load:
+            self.assertEqual(self.testee.cert_key_by_uuid(uuid="1x1"),
+                             public_key)
+            self.assertEqual(self.testee.load_all_public_keys(),
+                             {"1x1": public_key})
+            load.assert_not_called()
+
+        expected = {"1x1": public_key}
+        for label in ("a", "b", "c"):
+            public_file, secret_file = zmq.auth.create_certificates(
+                self.public_dir, label)
+            expected[label] = zmq.auth.load_certificate(public_file)[0]
+        self.assertEqual(self.testee.load_all_public_keys(workers=4),
+                         expected)
+
+    def test_exchange_many(self):
+        self.testee.prepare_cert_store("1x1")
+        others = []
+        for label in ("2x2", "3x3"):
+            other = SecurityManager(
+                private_cert_dir=tempfile.mkdtemp(),
+                public_cert_dir=tempfile.mkdtemp(),
+                temp_cert_dir=self.temp_cert_dir)
+            self.addCleanup(shutil.rmtree, other.private_cert_dir)
+            self.addCleanup(shutil.rmtree, other.public_cert_dir)
+            other.prepare_cert_store(label)
+            others.append(other)
+        self.testee.auth_thread = MagicMock()
+        others[0].auth_thread = MagicMock()
+
+        SecurityManager.exchange_many(
+            [(self.testee, others[0]), (self.testee, others[1])])
+        self.testee.auth_thread.configure_curve.assert_called_once_with(
+            domain='*', location=self.public_dir)
+        others[0].auth_thread.configure_curve.assert_called_once()
+        self.assertEqual(set(self.testee.load_all_public_keys()),
+                         {"1x1", "2x2", "3x3"})
+        self.assertEqual(set(others[1].load_all_public_keys()),
+                         {"1x1", "3x3"})
 
     def test_start_auth(self):
         with patch('p2p0mq.security.ThreadAuthenticator',